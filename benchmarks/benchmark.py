@@ -0,0 +1,326 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+# インストールしていなくても、このリポジトリの kkgw を読み込む
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from kkgw.math import DifferentialEquation as DE
+from kkgw.math.Simulation import Calc1d, Calc2d
+from kkgw.math.Solver import NewtonSolver
+from kkgw.math.Storage import TrajectoryStore
+from kkgw.math.Visualization import Anim2d
+
+# 各ベンチマークで変える格子点数 N (内部領域の分割数)
+SIZES = (100, 1000, 10000, 100000)
+
+# 1次元の方程式クラスの設定 (1回あたりの時間だけを測るので陽的スキームの安定条件は気にしない)
+SETTINGS = {'Dx': 0.5, 'Dt': 0.1}
+PARAMS = {'Gamma': 2, 'const': 0.25}
+
+def timeit(func, repeat: int = 5, min_time: float = 0.05) -> dict:
+    """
+    func() の1回あたりの時間[秒]
+    1回目で回数 number を決め(1組が min_time 以上になるように)、number 回を1組として repeat 組測る
+    Return
+    ------
+    {'median', 'min', 'number', 'repeat'}
+    """
+    start = time.perf_counter()
+    func()
+    first = time.perf_counter() - start
+    number = max(1, int(min_time / first)) if first > 0 else 1000
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - start) / number)
+    return {'median': statistics.median(times), 'min': min(times), 'number': number, 'repeat': repeat}
+
+def _initial(N: int) -> np.ndarray:
+    """ 仮想点込みの長さ N+4 の初期値 (鏡映条件を満たす) """
+    x = np.arange(N+4)
+    U = 0.1*np.cos(4*np.pi*x/(N+4))
+    U[[0, 1, N+2, N+3]] = U[[4, 3, N, N-1]]
+    return U
+
+def _equations(N: int) -> dict:
+    """ {名前: (方程式クラスのインスタンス, 初期値)} """
+
+    settings = dict(SETTINGS, N=N)
+    cfg = SimpleNamespace(settings=settings, params=dict(PARAMS))
+    heat = 0.1*np.cos(np.linspace(0, 4*np.pi, N))
+    return {
+        'CH-DVDM': (DE.CahnHilliardEq_NeumannBC_1d_DVDM(settings, dict(PARAMS)), _initial(N)),
+        'CH-Stabilized': (DE.CahnHilliardEq_NeumannBC_1d_Stabilized(settings, dict(PARAMS)), _initial(N)),
+        'CH-FwdEuler': (DE.CahnHilliardEq_NeumannBC_1d_FwdEuler(settings, dict(PARAMS)), _initial(N)),
+        'Heat-Neumann': (DE.HeatEq_NeumannBC_1d_DVDM(cfg), heat),
+        'Heat-Reaction': (DE.HeatEq_ReactionBC_1d_DVDM(cfg), heat),
+    }
+
+def bench_equation(N: int) -> dict:
+    """ 各クラスの equation(U2, U1) """
+    return {name: (lambda eq=eq, U=U: eq.equation(U, U)) for name, (eq, U) in _equations(N).items()}
+
+def bench_chem_func(N: int) -> dict:
+    """ Cahn-Hilliard の各クラスの chem_func """
+    output = {}
+    for name, (eq, U) in _equations(N).items():
+        if not hasattr(eq, 'chem_func'):
+            continue
+        if name == 'CH-FwdEuler':
+            output[name] = lambda eq=eq, U=U: eq.chem_func(U)
+        else:
+            output[name] = lambda eq=eq, U=U: eq.chem_func(U, U)
+    return output
+
+def bench_energy(N: int) -> dict:
+    """ Cahn-Hilliard の各クラスの local_energy と energy """
+    output = {}
+    for name, (eq, U) in _equations(N).items():
+        if hasattr(eq, 'energy'):
+            output[name] = lambda eq=eq, U=U: eq.energy(eq.local_energy(U))
+    return output
+
+class _CFG():
+    """ Calc1d に渡す設定 (cfg.pkl に保存できるようにモジュールの最上位で定義する) """
+    def __init__(self, settings: dict, output_dir: str, U0=None):
+        self.settings = settings
+        self.params = dict(PARAMS)
+        self.timeset = {'inittime': 0, 'timespan': 1, 'brank': 1, 'plt_inittime': 0, 'plt_timespan': 1}
+        self.output_dir = output_dir
+        self.U0 = U0 # 初期値
+
+    def initialdata(self, idx):
+        return self.U0[idx]
+
+class _CFG2d(_CFG):
+    """ Calc2d に渡す設定 """
+    def initialdata(self, X, Y):
+        return 0.1*np.cos(0.3*X)*np.cos(0.2*Y)
+
+def bench_calc(N: int, workdir: str) -> dict:
+    """
+    Calc1d.calc の1ステップ (初期値の読み出し, 1ステップの求解, 保存を含む)
+    optimize.root は密なヤコビ行列を作るので N <= 1000 だけ
+    """
+
+    cases = {
+        'CH-DVDM-newton': ('CH-DVDM', lambda: NewtonSolver()),
+        'CH-DVDM-chord': ('CH-DVDM', lambda: NewtonSolver(chord=True)),
+        'CH-Stabilized-linear': ('CH-Stabilized', lambda: None),
+        'CH-FwdEuler-explicit': ('CH-FwdEuler', lambda: None),
+        'Heat-Neumann-linear': ('Heat-Neumann', lambda: None),
+        'Heat-Reaction-newton': ('Heat-Reaction', lambda: NewtonSolver()),
+    }
+    if N <= 1000:
+        cases['CH-DVDM-root'] = ('CH-DVDM', lambda: None)
+
+    equations = _equations(N)
+    output = {}
+    for case, (name, make_solver) in cases.items():
+        eq, U = equations[name]
+        cfg = _CFG(dict(SETTINGS, N=len(U)), os.path.join(workdir, case), U)
+        calc = Calc1d(cfg)
+        with contextlib.redirect_stdout(io.StringIO()):
+            calc.preparation()
+
+        def run(calc=calc, eq=eq, make_solver=make_solver):
+            with contextlib.redirect_stdout(io.StringIO()):
+                calc.calc(eq.equation, solver=make_solver())
+        output[case] = run
+
+    # 2次元 (格子点の総数が N 程度の正方格子)
+    n = max(4, int(round(np.sqrt(N))))
+    settings = {'Nx': n, 'Ny': n, 'Dx': 0.5, 'Dy': 0.5, 'Dt': 0.1}
+    cfg = _CFG2d(settings, os.path.join(workdir, 'CH2d-spectral'))
+    calc = Calc2d(cfg)
+    with contextlib.redirect_stdout(io.StringIO()):
+        calc.preparation()
+    eq = DE.CahnHilliardEq_NeumannBC_2d_Spectral(settings, dict(PARAMS))
+
+    def run2d(calc=calc, eq=eq):
+        with contextlib.redirect_stdout(io.StringIO()):
+            calc.calc(eq.equation)
+    output['CH2d-spectral'] = run2d
+    return output
+
+def bench_io(N: int, workdir: str) -> dict:
+    """ TrajectoryStore への1時刻の追記(ディスクまで)と読み出し """
+
+    U = np.random.default_rng(0).standard_normal(N)
+    store = TrajectoryStore(os.path.join(workdir, 'io'), 'U')
+    store.clear()
+    for step in range(10):
+        store.append(step, float(step), U)
+    store.flush()
+    counter = [10]
+
+    def append():
+        store.append(counter[0], float(counter[0]), U)
+        store.flush()
+        counter[0] += 1
+
+    def load():
+        return np.array(store.load(5))
+    return {'append': append, 'load': load}
+
+def bench_render(N: int, workdir: str, nframe: int = 5) -> dict:
+    """ Anim2d.render の1コマあたり (nframe コマを gif に書く時間 / nframe) """
+
+    output_dir = os.path.join(workdir, 'render')
+    with TrajectoryStore(os.path.join(output_dir, 'var'), 'U') as store:
+        store.clear()
+        for step in range(nframe):
+            store.append(step, step*0.1, np.sin(np.linspace(0, 6, N) + 0.1*step))
+    cfg = SimpleNamespace(
+        settings={'N': N, 'Dx': 0.5, 'Dt': 0.1},
+        timeset={'plt_inittime': 0, 'plt_timespan': nframe-1, 'brank': 1},
+        output_dir=output_dir,
+    )
+    anim = Anim2d(cfg)
+    steps = list(range(nframe))
+    path = os.path.join(anim.output_fig, 'U.gif')
+
+    def frame():
+        anim.render('U', steps, path)
+    frame.frames = nframe # run で timeit の結果を1コマあたりに直す
+    return {'frame': frame}
+
+# {グループ名: (関数, 作業用フォルダを使うか, 既定の N の上限)}
+BENCHMARKS = {
+    'equation': (bench_equation, False, None),
+    'chem_func': (bench_chem_func, False, None),
+    'energy': (bench_energy, False, None),
+    'calc': (bench_calc, True, None),
+    'io': (bench_io, True, None),
+    'render': (bench_render, True, 10000),
+}
+
+def environment() -> dict:
+    """ 結果と一緒に保存する実行環境 """
+    import scipy
+
+    commit = None
+    with contextlib.suppress(Exception):
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'commit': commit,
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+def run(groups=None, sizes=SIZES, repeat: int = 5, min_time: float = 0.05, verbose: bool = True) -> dict:
+    """
+    ベンチマークを実行する
+    Parameter
+    ---------
+    groups: list
+        BENCHMARKS のグループ名 (省略時はすべて)
+    sizes: tuple
+        格子点数 N
+    Return
+    ------
+    {'environment': ..., 'results': {'グループ/名前': {'N': {'median', 'min', 'number', 'repeat'}}}}
+    """
+    groups = list(BENCHMARKS) if groups is None else groups
+    results = {}
+    workdir = tempfile.mkdtemp(prefix='kkgw-bench-')
+    try:
+        for group in groups:
+            func, use_dir, max_size = BENCHMARKS[group]
+            for N in sizes:
+                if max_size is not None and N > max_size:
+                    continue
+                cases = func(N, os.path.join(workdir, f'{group}-{N}')) if use_dir else func(N)
+                for name, case in cases.items():
+                    result = timeit(case, repeat=repeat, min_time=min_time)
+                    frames = getattr(case, 'frames', 1)
+                    for key in ('median', 'min'):
+                        result[key] /= frames
+                    results.setdefault(f'{group}/{name}', {})[str(N)] = result
+                    if verbose:
+                        print(f"{group + '/' + name:<34} N={N:<7d} {result['median']*1e6:12.1f} us")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {'environment': environment(), 'results': results}
+
+def save(report: dict, path: str):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+def compare(baseline: dict, current: dict, threshold: float = 1.25) -> list:
+    """
+    baseline と current の中央値の比
+    Return
+    ------
+    [(名前, N, baseline[秒], current[秒], 比, 遅くなったか)] (比 > threshold で遅くなったとみなす)
+    """
+    output = []
+    for name, by_size in current['results'].items():
+        for N, result in by_size.items():
+            base = baseline['results'].get(name, {}).get(N)
+            if base is None:
+                continue
+            ratio = result['median'] / base['median']
+            output.append((name, int(N), base['median'], result['median'], ratio, ratio > threshold))
+    return output
+
+def main(argv=None):
+    """
+    コンソールから実行する
+    ======
+    $ python benchmarks/benchmark.py --sizes 100 1000 10000 --output bench.json
+    $ python benchmarks/benchmark.py --groups equation calc --compare bench.json
+    遅くなったものがあれば終了コード 1
+    """
+    parser = argparse.ArgumentParser(description='kkgw.math benchmarks')
+    parser.add_argument('--groups', nargs='*', choices=list(BENCHMARKS), default=None)
+    parser.add_argument('--sizes', nargs='*', type=int, default=list(SIZES))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.05)
+    parser.add_argument('--output', default=None, help='結果を保存する JSON ファイル')
+    parser.add_argument('--compare', default=None, help='比べる基準の JSON ファイル')
+    parser.add_argument('--threshold', type=float, default=1.25, help='この比より遅くなったら失敗')
+    args = parser.parse_args(argv)
+
+    report = run(args.groups, args.sizes, args.repeat, args.min_time)
+    if args.output is not None:
+        save(report, args.output)
+
+    status = 0
+    if args.compare is not None:
+        for name, N, base, current, ratio, slower in compare(load(args.compare), report, args.threshold):
+            mark = 'SLOWER' if slower else ''
+            print(f'{name:<34} N={N:<7d} {base*1e6:12.1f} -> {current*1e6:12.1f} us  x{ratio:.2f} {mark}')
+            status = 1 if slower else status
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,221 @@
+import copy
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from .Simulation import Calc1d, stable_hash
+from .Storage import TrajectoryStore, normalize_policy
+
+def dir_size(path: str) -> int:
+    """ フォルダ以下のファイルの合計バイト数 """
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+class RunCache():
+    """
+    計算結果のキャッシュ
+    設定のハッシュ (stable_hash) ごとに {root}/{key}/ に Calc1d と同じ形で計算結果を置く
+    同じ設定ならすぐに保存済みの結果を返し、timespan が長ければ保存済みの最後の解から続きだけ計算する
+    (cfg.output_policy で U を間引いたり丸めたりして保存した計算は、続きではなく最初から計算し直す)
+
+    フォルダ階層
+    {root}---{key}---var, cfg.pkl, cfg.json   <- Calc1d.preparation, Calc1d.calc
+                   |-cache.json               <- 計算済みの最後の時刻ステップ, 最後に使った時刻, 大きさ
+
+    cache = RunCache('./data/cache', max_bytes=10*1024**3)
+    calc, status = cache.run(cfg, make_equation, solver=NewtonSolver())
+    Plot2d(calc.output_dir).snapshots('U')
+    """
+
+    def __init__(self, root: str = './data/cache', max_runs: int = None, max_bytes: int = None):
+        """
+        Parameter
+        ---------
+        max_runs: int
+            残す計算の数の上限 (超えたら最後に使ったのが古いものから消す)
+        max_bytes: int
+            キャッシュ全体の大きさの上限[バイト]
+        """
+        self.root = root
+        self.max_runs = max_runs
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def meta(self, key: str) -> dict:
+        """ キャッシュの記録 (なければ None) """
+        try:
+            with open(os.path.join(self.path(key), 'cache.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def write_meta(self, key: str, meta: dict):
+        # 書きかけのファイルを読まないように置き換える
+        path = os.path.join(self.path(key), 'cache.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(path + '.tmp', path)
+
+    @staticmethod
+    def policy_config(cfg_inst) -> dict:
+        """
+        キーに含める保存の方針 (間引きや丸めをした結果を劣化なしの結果として返さないため)
+        既定の方針は含めないので、方針を指定しない計算のキーは変わらない
+        """
+        default = normalize_policy(None)
+        policy = {}
+        for varname, value in sorted(getattr(cfg_inst, 'output_policy', {}).items()):
+            if normalize_policy(value) != default:
+                policy[varname] = normalize_policy(value)
+        return {'output_policy': policy} if policy else {}
+
+    def resumable(self, key: str, step: int) -> bool:
+        """ 保存済みの計算を時刻ステップ step の解から続けられるか (その解が劣化なしで保存されている) """
+        with TrajectoryStore(os.path.join(self.path(key), 'var'), 'U') as store:
+            return len(store) > 0 and store.lossless and int(store.steps[-1]) == step
+
+    def install(self, staging: str, key: str, endtime: int) -> dict:
+        """
+        staging で計算し終えた結果をキーの名前に置く
+        Return
+        ------
+        同時に同じ計算が endtime まで終わっていたらその記録 (staging は使わない)、staging を置いたら None
+        """
+        path = self.path(key)
+        for _ in range(2):
+            try:
+                os.rename(staging, path)
+                return None
+            except OSError:
+                meta = self.meta(key)
+                if meta is not None and meta['endtime'] >= endtime:
+                    return meta
+            # cache.json のないフォルダ(途中で止まった計算)や短い計算は消してから置き直す
+            # 一旦 '.' で始まる名前に変えるので、消している途中のフォルダをキーとして読むことはない
+            trash = tempfile.mkdtemp(prefix='.trash-', dir=self.root)
+            try:
+                os.rename(path, os.path.join(trash, key))
+            except FileNotFoundError:
+                pass
+            shutil.rmtree(trash, ignore_errors=True)
+        os.rename(staging, path)
+        return None
+
+    def entries(self) -> dict:
+        """ {キー: キャッシュの記録} """
+        output = {}
+        for key in os.listdir(self.root):
+            if key.startswith('.'):
+                continue
+            meta = self.meta(key)
+            if meta is not None:
+                output[key] = meta
+        return output
+
+    def run(self, cfg_inst, make_equation, calc_class=Calc1d, **kwargs):
+        """
+        キャッシュを使って計算する
+        Parameter
+        ---------
+        cfg_inst:
+            CFG のインスタンス (output_dir は使わない、inittime から timespan ステップまでの結果を返す)
+        make_equation:
+            cfg から方程式クラスの equation メソッドを作る関数 (Sweep と同じ)
+        calc_class:
+            Calc1d または Calc2d
+        kwargs:
+            Calc1d.calc に渡す引数 (fuse, solver など、キーには含めない)
+        Return
+        ------
+        (calc, status)
+            calc: 結果を読むための calc_class のインスタンス (output_dir はキャッシュのフォルダ)
+            status: 'hit' (保存済み), 'extended' (続きを計算), 'new' (新しく計算)
+        """
+        cfg = copy.deepcopy(cfg_inst)
+        endtime = cfg.timeset['inittime'] + cfg.timeset['timespan']
+        cfg.timeset = dict(cfg.timeset, inittime=0, timespan=endtime)
+
+        # 新しい計算は一時フォルダで行い、終わってからキーの名前に変える(途中で止まった計算を残さない)
+        staging = tempfile.mkdtemp(prefix='.staging-', dir=self.root)
+        try:
+            cfg.output_dir = staging
+            calc = calc_class(cfg)
+            equation = make_equation(cfg)
+            key = stable_hash(cfg, equation, calc.initialstate(), brank=cfg.timeset['brank'], **self.policy_config(cfg))
+            meta = self.meta(key)
+            if meta is not None and meta['endtime'] < endtime and not self.resumable(key, meta['endtime']):
+                # 最後の時刻の解がない(または丸めて保存した)記録は続きを計算できないので消して計算し直す
+                shutil.rmtree(self.path(key), ignore_errors=True)
+                meta = None
+
+            if meta is None:
+                status = 'new'
+                calc.preparation()
+                calc.calc(equation, **kwargs)
+                meta = self.install(staging, key, endtime) or {
+                    'key': key,
+                    'scheme': type(equation.__self__).__qualname__,
+                    'endtime': 0,
+                    'created': time.time(),
+                    'hits': 0,
+                }
+            elif meta['endtime'] < endtime:
+                status = 'extended'
+                cfg.output_dir = self.path(key)
+                cfg.timeset = dict(cfg.timeset, inittime=meta['endtime'], timespan=endtime-meta['endtime'])
+                calc_class(cfg).calc(make_equation(cfg), **kwargs)
+            else:
+                status = 'hit'
+                meta['hits'] += 1
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+        if status != 'hit':
+            # cfg.json には計算済みの範囲を書く
+            meta['endtime'] = max(meta['endtime'], endtime)
+            cfg.output_dir = self.path(key)
+            cfg.timeset = dict(cfg.timeset, inittime=0, timespan=meta['endtime'])
+            calc_class(cfg).save_cfg()
+        meta['last_used'] = time.time()
+        meta['bytes'] = dir_size(self.path(key))
+        self.write_meta(key, meta)
+        self.evict(keep=key)
+
+        cfg = copy.deepcopy(cfg_inst)
+        cfg.output_dir = self.path(key)
+        return calc_class(cfg), status
+
+    def evict(self, keep: str = None):
+        """ 上限を超えていたら最後に使ったのが古い計算から消す (keep は消さない) """
+        entries = sorted(self.entries().items(), key=lambda item: item[1].get('last_used', 0))
+        total = sum(meta.get('bytes', 0) for _, meta in entries)
+        count = len(entries)
+        for key, meta in entries:
+            over_runs = self.max_runs is not None and count > self.max_runs
+            over_bytes = self.max_bytes is not None and total > self.max_bytes
+            if not (over_runs or over_bytes):
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(self.path(key), ignore_errors=True)
+            total -= meta.get('bytes', 0)
+            count -= 1
+
+    def clear(self):
+        """ キャッシュを全部消す (cache.json のないフォルダも消す) """
+        for key in os.listdir(self.root):
+            if not key.startswith('.staging-'):
+                shutil.rmtree(self.path(key), ignore_errors=True)
@@ -0,0 +1,66 @@
+import os
+
+import numpy as np
+
+class Diagnostics():
+    """
+    時間発展の途中で質量やエネルギーなどのスカラー量を計算して時系列として保存する
+    値は TrajectoryStore に1つずつ追記するので、計算中のメモリ使用量は時間ステップ数によらない
+    計算の最後に旧形式の {output_dir}/var/{name}.npy (brank ごとの値) も書き出す
+    Plot2d.timeseries は TrajectoryStore の実際の時刻に対して描く
+
+    Calc1d.calc(equation, diagnostics=Diagnostics(ch.diagnostics))
+    """
+
+    def __init__(self, funcs, every: int = 0):
+        """
+        Parameter
+        ---------
+        funcs:
+            U を受け取って {名前: 値} を返す関数 (方程式クラスの diagnostics など)
+            または {名前: U を受け取って値を返す関数} の辞書
+        every: int
+            0 なら解を保存する時刻ステップごと、正ならこのステップ数ごとに計算する
+        """
+        self.funcs = funcs
+        self.every = every
+        self.names = [] # 記録する量の名前
+
+    def evaluate(self, U) -> dict:
+        """ 解 U の各量 """
+        if callable(self.funcs):
+            return self.funcs(U)
+        return {name: func(U) for name, func in self.funcs.items()}
+
+    def due(self, t: int, saved: bool) -> bool:
+        """ 時刻ステップ t で計算するか """
+        if self.every > 0:
+            return t % self.every == 0
+        return saved
+
+    def start(self, calc, t: int, U):
+        """ 計算開始時: 時刻ステップ t 以降の記録を消して初期値を記録する """
+        self.names = list(self.evaluate(U))
+        for name in self.names:
+            calc.store(name).truncate(t-1)
+        self.record(calc, t, U)
+
+    def record(self, calc, t: int, U):
+        Dt = calc.settings['Dt']
+        for name, value in self.evaluate(U).items():
+            calc.write(calc.store(name).append, t, t*Dt, np.atleast_1d(np.asarray(value, dtype=float)))
+
+    def finish(self, calc):
+        """
+        計算終了時: brank ごとの値を {name}.npy に書き出す
+        every が brank を割り切らないときは brank ごとの値がそろわないので書かない(古いものは消す)
+        """
+        brank = calc.timeset['brank']
+        for name in self.names:
+            path = os.path.join(calc.output_var, f'{name}.npy')
+            if self.every > 0 and brank % self.every != 0:
+                if os.path.exists(path):
+                    os.remove(path)
+                continue
+            steps, times, data = calc.store(name).window()
+            np.save(path, np.asarray(data[steps % brank == 0, 0]))
@@ -1,5 +1,9 @@
 import numpy as np
 
+from .Operator import (
+    diags_by_row, from_spectral, get_workspace, ghost_rows_1d, lap, laplacian, laplacian_symbol, to_spectral,
+)
+
 class CahnHilliardEq_NeumannBC_1d_DVDM():
 
     def __init__(
@@ -16,55 +20,100 @@ class CahnHilliardEq_NeumannBC_1d_DVDM():
     ):
         self.settings = settings # space dimension
         self.params = params # parameters
+        self.ws = None # 残差と作業用の配列 (Workspace)
 
     def Laplacian(self, N) -> np.ndarray:
-        output = np.zeros((N, N+2))
-        for k in range(0, N):
-            output[k, k:k+3] = [1, -2, 1]
-        return output
+        """ ラプラシアン(仮想点込み, 書き換えてよい密行列) """
+        return self.SparseLaplacian(N).toarray()
 
-    def chem_func(self, U1, U2) -> np.ndarray:
-        """ 化学ポテンシャル """
+    def SparseLaplacian(self, N):
+        """ ラプラシアン(仮想点込み, キャッシュされた読み出し専用の疎行列) """
+        return laplacian(N, 'ghost')
+
+    def chem_func(self, U1, U2, out=None) -> np.ndarray:
+        """ 化学ポテンシャル (out を渡すとそこに書き込む) """
         N = self.settings['N']
         Dx = self.settings['Dx']
         Gamma = self.params['Gamma']
         const = self.params['const']
-        U1tmp = U1[1:N+3]
-        U2tmp = U2[1:N+3]
-
-        Lap = self.Laplacian(N+2)
-        output = Gamma/2/Dx**2 * np.dot(Lap, (U1 + U2)) \
-            - const * (U2tmp**3 + U2tmp**2 * U1tmp + U2tmp * U1tmp**2 + U1tmp**3) \
-            + 2*const * (U2tmp + U1tmp)
+        self.ws = get_workspace(self.ws, np.shape(U2))
+        U1tmp = U1[..., 1:N+3]
+        U2tmp = U2[..., 1:N+3]
+        Ssum = self.ws.work[0]
+        T = self.ws.work[1][..., 1:N+3]
+        R = self.ws.work[2][..., 1:N+3]
+        output = np.empty(np.shape(U2tmp)) if out is None else out
+
+        np.add(U1, U2, out=Ssum)
+        lap(Ssum, out=output)
+        output *= Gamma/2/Dx**2
+        # U2^3 + U2^2 U1 + U2 U1^2 + U1^3 = (U2 + U1)(U2^2 + U1^2) なので
+        # 局所項は const (U2 + U1)(2 - U2^2 - U1^2)
+        np.square(U1tmp, out=T)
+        np.square(U2tmp, out=R)
+        T += R
+        np.subtract(2, T, out=T)
+        T *= Ssum[..., 1:N+3]
+        T *= const
+        output += T
         return output
 
-    def equation(self, U2, U1) -> list:
-        """ 方程式 """
+    def equation(self, U2, U1) -> np.ndarray:
+        """
+        方程式
+        戻り値は作業領域の配列で、次の呼び出しで上書きされる(残す場合はコピーする)
+        """
         N = self.settings['N']
         Dx = self.settings['Dx']
         Dt = self.settings['Dt']
 
-        Lap = self.Laplacian(N)
-
-        eq = [0]*(N+4)
+        self.ws = get_workspace(self.ws, np.shape(U2))
+        eq = self.ws.eq
         # ノートでは k = -2, -1, 0, 1, ... , K-1, K, K+1 だが
         # ここでは k = 0, 1, 2, ... , K+1, K+2, K+3=Nx-1
         # 内部の U2 は k = 2, ... ,K+1
-
-        eq[0] = U2[0] - U2[4]
-        eq[1] = U2[1] - U2[3]
-        eq[2:N+2] = U2[2:N+2] - U1[2:N+2] + Dt/Dx**2 * np.dot(Lap, self.chem_func(U1, U2))
-        eq[N+2] = U2[N+2] - U2[N]
-        eq[N+3] = U2[N+3] - U2[N-1]
+        # 先頭の軸があればアンサンブルの各メンバー
+
+        np.subtract(U2[..., 0], U2[..., 4], out=eq[..., 0])
+        np.subtract(U2[..., 1], U2[..., 3], out=eq[..., 1])
+        inner = eq[..., 2:N+2]
+        lap(self.chem_func(U1, U2, out=self.ws.work[3][..., :N+2]), out=inner)
+        inner *= Dt/Dx**2
+        inner += U2[..., 2:N+2]
+        inner -= U1[..., 2:N+2]
+        np.subtract(U2[..., N+2], U2[..., N], out=eq[..., N+2])
+        np.subtract(U2[..., N+3], U2[..., N-1], out=eq[..., N+3])
 
         return eq
 
+    def jacobian(self, U2, U1):
+        """ 方程式の U2 についてのヤコビ行列(5重対角+仮想点の行) """
+        N = self.settings['N']
+        Dx = self.settings['Dx']
+        Dt = self.settings['Dt']
+        Gamma = self.params['Gamma']
+        const = self.params['const']
+        c = Dt/Dx**2
+        g = Gamma/2/Dx**2
+
+        # 化学ポテンシャルの局所項の微分 (k = 1, ... , K+2 で使う)
+        d = - const * (3*U2**2 + 2*U2*U1 + U1**2) + 2*const
+
+        rows = {k: np.zeros(np.shape(U2)) for k in (-4, -2, -1, 0, 1, 2, 4)}
+        inner = (..., slice(2, N+2))
+        rows[-2][inner] = c*g
+        rows[-1][inner] = -4*c*g + c*d[..., 1:N+1]
+        rows[0][inner] = 1 + 6*c*g - 2*c*d[..., 2:N+2]
+        rows[1][inner] = -4*c*g + c*d[..., 3:N+3]
+        rows[2][inner] = c*g
+        return diags_by_row(ghost_rows_1d(N, rows), N+4)
+
     def mass(self, Utmp) -> float:
         """ 質量 """
         N = self.settings['N']
         Dx = self.settings['Dx']
 
-        output = (Utmp.sum() - Utmp[0]/2 - Utmp[N-1]/2) * Dx # cf. OFFY(2020)式(11)
+        output = (Utmp.sum(axis=-1) - Utmp[..., 0]/2 - Utmp[..., N-1]/2) * Dx # cf. OFFY(2020)式(11)
         return output
 
     def local_energy(self, Utmp) -> np.ndarray:
@@ -74,10 +123,10 @@ class CahnHilliardEq_NeumannBC_1d_DVDM():
         Gamma = self.params['Gamma']
         const = self.params['const']
 
-        G = np.zeros(N)
-        for k in range(2, N+2):
-            i = k-2
-            G[i] = const*(Utmp[k]**4 - 2*Utmp[k]**2 + 1) + Gamma/4/(Dx**2)*((Utmp[k+1]-Utmp[k])**2 + (Utmp[k]-Utmp[k-1])**2)
+        # k = 2, ... , K+1 について一度に計算する
+        Uk = Utmp[..., 2:N+2]
+        dU = np.diff(Utmp[..., 1:N+3], axis=-1) # U[k+1] - U[k] (k = 1, ... , K+1)
+        G = const*(Uk**4 - 2*Uk**2 + 1) + Gamma/4/(Dx**2)*(dU[..., 1:]**2 + dU[..., :-1]**2)
         return G
 
     def energy(self, G: np.ndarray) -> float:
@@ -91,10 +140,112 @@ class CahnHilliardEq_NeumannBC_1d_DVDM():
         N = self.settings['N']
         Dx = self.settings['Dx']
 
-        # output = (sum(G) - G[0]/2 - G[N-1]/2) * Dx
-        output = (G.sum() - G[0]/2 - G[N-1]/2) * Dx
+        output = (G.sum(axis=-1) - G[..., 0]/2 - G[..., N-1]/2) * Dx
+        return output
+
+    def diagnostics(self, U) -> dict:
+        """ 仮想点込みの解 U の質量と離散全エネルギー (Diagnostics の既定値) """
+        N = self.settings['N']
+        return {
+            'mass': self.mass(U[..., 2:N+2]),
+            'energy': self.energy(self.local_energy(U)),
+        }
+
+class CahnHilliardEq_NeumannBC_1d_Stabilized(CahnHilliardEq_NeumannBC_1d_DVDM):
+    """
+    安定化半陰的スキーム
+    二重井戸型ポテンシャルを凸な2次関数 S/2 u^2 とその残りに分けた線形の凸分割 (Eyre)
+        mu^{n+1} = - Gamma Lap u^{n+1} + S (u^{n+1} - u^n) + F'(u^n),  F'(u) = 4 const (u^3 - u)
+    各ステップは定数係数の5重対角の線形方程式を1回解くだけ (linear = True)
+    S >= max|F''|/2 (F''(u) = const (12 u^2 - 4)) なら離散全エネルギーは減少する
+    仮想点の配置と mass, local_energy, energy は CahnHilliardEq_NeumannBC_1d_DVDM と同じ
+    """
+    linear = True # equation は U2 について線形 (system_matrix と rhs で直接解ける)
+
+    def __init__(
+        self,
+        settings: dict = {
+            'N': 10, # 内部領域の分割数
+            'Dx': 0.5, # 領域の分割幅
+            'Dt': 0.5, # 時間の分割幅
+        },
+        params: dict = {
+            'Gamma': 2, # 拡散項の係数
+            'const': 0.25, # 二重井戸型ポテンシャルの係数
+            'S': 2, # 安定化項の係数 (省略時は 8*const)
+        }
+    ):
+        super().__init__(settings, params)
+
+    def stabilizer(self):
+        """ 安定化項の係数 S """
+        return self.params.get('S', 8*self.params['const'])
+
+    def chem_func(self, U1, U2, out=None) -> np.ndarray:
+        """ 化学ポテンシャル (DVDM と同じく符号を反転したもの, out を渡すとそこに書き込む) """
+        N = self.settings['N']
+        Dx = self.settings['Dx']
+        Gamma = self.params['Gamma']
+        const = self.params['const']
+        S = self.stabilizer()
+        self.ws = get_workspace(self.ws, np.shape(U2))
+        U1tmp = U1[..., 1:N+3]
+        U2tmp = U2[..., 1:N+3]
+        T = self.ws.work[1][..., 1:N+3]
+        output = np.empty(np.shape(U2tmp)) if out is None else out
+
+        # Gamma/Dx^2 lap(U2) - S (U2 - U1) - 4 const (U1^3 - U1)
+        lap(U2, out=output)
+        output *= Gamma/Dx**2
+        np.subtract(U2tmp, U1tmp, out=T)
+        T *= S
+        output -= T
+        np.square(U1tmp, out=T)
+        T -= 1
+        T *= U1tmp
+        T *= const * 4
+        output -= T
         return output
 
+    def jacobian(self, U2, U1):
+        """ 方程式の U2 についてのヤコビ行列(5重対角+仮想点の行, 時間によらない) """
+        N = self.settings['N']
+        Dx = self.settings['Dx']
+        Dt = self.settings['Dt']
+        Gamma = self.params['Gamma']
+        S = self.stabilizer()
+        c = Dt/Dx**2
+        g = Gamma/Dx**2
+
+        rows = {k: np.zeros(np.shape(U2)) for k in (-4, -2, -1, 0, 1, 2, 4)}
+        inner = (..., slice(2, N+2))
+        rows[-2][inner] = c*g
+        rows[-1][inner] = -4*c*g - c*S
+        rows[0][inner] = 1 + 6*c*g + 2*c*S
+        rows[1][inner] = -4*c*g - c*S
+        rows[2][inner] = c*g
+        return diags_by_row(ghost_rows_1d(N, rows), N+4)
+
+    def system_matrix(self, U1):
+        """
+        equation(U2, U1) = A U2 - b の係数行列 A
+        U1 は形(アンサンブルのメンバー数)を決めるためだけに使う
+        """
+        return self.jacobian(U1, U1)
+
+    def rhs(self, U1) -> np.ndarray:
+        """ equation(U2, U1) = A U2 - b の右辺 b """
+        N = self.settings['N']
+        Dx = self.settings['Dx']
+        Dt = self.settings['Dt']
+        const = self.params['const']
+        S = self.stabilizer()
+        U1tmp = U1[..., 1:N+3]
+
+        b = np.zeros(np.shape(U1))
+        b[..., 2:N+2] = U1[..., 2:N+2] - Dt/Dx**2 * lap(S*U1tmp - const*4*(U1tmp**3 - U1tmp))
+        return b
+
 class CahnHilliardEq_NeumannBC_1d_FwdEuler():
 
     def __init__(
@@ -111,52 +262,99 @@ class CahnHilliardEq_NeumannBC_1d_FwdEuler():
     ):
         self.settings = settings # space dimension
         self.params = params # parameters
+        self.ws = None # 残差と作業用の配列 (Workspace)
 
     def Laplacian(self, N) -> np.ndarray:
-        output = np.zeros((N, N+2))
-        for k in range(0, N):
-            output[k, k:k+3] = [1, -2, 1]
-        return output
+        """ ラプラシアン(仮想点込み, 書き換えてよい密行列) """
+        return self.SparseLaplacian(N).toarray()
+
+    def SparseLaplacian(self, N):
+        """ ラプラシアン(仮想点込み, キャッシュされた読み出し専用の疎行列) """
+        return laplacian(N, 'ghost')
 
-    def chem_func(self, U1):
-        """ 化学ポテンシャル """
+    def chem_func(self, U1, out=None):
+        """ 化学ポテンシャル (out を渡すとそこに書き込む) """
         N = self.settings['N']
         Dx = self.settings['Dx']
         Gamma = self.params['Gamma']
         const = self.params['const']
-
-        Lap = self.Laplacian(N+2)
-        output = Gamma/Dx**2 * np.dot(Lap, U1) \
-            - const * 4*(U1[1:-1]**3 - U1[1:-1])
+        self.ws = get_workspace(self.ws, np.shape(U1))
+        U1tmp = U1[..., 1:-1]
+        T = self.ws.work[1][..., 1:-1]
+        output = np.empty(np.shape(U1tmp)) if out is None else out
+
+        lap(U1, out=output)
+        output *= Gamma/Dx**2
+        np.square(U1tmp, out=T)
+        T -= 1
+        T *= U1tmp
+        T *= const * 4
+        output -= T
         return output
 
-    def equation(self, U2, U1) -> list:
-        """ 方程式 """
+    def equation(self, U2, U1) -> np.ndarray:
+        """
+        方程式
+        戻り値は作業領域の配列で、次の呼び出しで上書きされる(残す場合はコピーする)
+        """
         N = self.settings['N']
         Dx = self.settings['Dx']
         Dt = self.settings['Dt']
 
-        Lap = self.Laplacian(N)
-
-        eq = [0]*(N+4)
+        self.ws = get_workspace(self.ws, np.shape(U2))
+        eq = self.ws.eq
         # ノートでは k = -2, -1, 0, 1, ... , K-1, K, K+1 だが
         # ここでは k = 0, 1, 2, ... , K+1, K+2, K+3=Nx-1
         # 内部の U2 は k = 2, ... ,K+1
-
-        eq[0] = U2[0] - U2[4]
-        eq[1] = U2[1] - U2[3]
-        eq[2:N+2] = U2[2:N+2] - U1[2:N+2] + Dt/Dx**2 * np.dot(Lap, self.chem_func(U1))
-        eq[N+2] = U2[N+2] - U2[N]
-        eq[N+3] = U2[N+3] - U2[N-1]
+        # 先頭の軸があればアンサンブルの各メンバー
+
+        np.subtract(U2[..., 0], U2[..., 4], out=eq[..., 0])
+        np.subtract(U2[..., 1], U2[..., 3], out=eq[..., 1])
+        inner = eq[..., 2:N+2]
+        lap(self.chem_func(U1, out=self.ws.work[3][..., :N+2]), out=inner)
+        inner *= Dt/Dx**2
+        inner += U2[..., 2:N+2]
+        inner -= U1[..., 2:N+2]
+        np.subtract(U2[..., N+2], U2[..., N], out=eq[..., N+2])
+        np.subtract(U2[..., N+3], U2[..., N-1], out=eq[..., N+3])
 
         return eq
 
+    def jacobian(self, U2, U1):
+        """ 方程式の U2 についてのヤコビ行列(U2 に依存しない) """
+        N = self.settings['N']
+
+        rows = {k: np.zeros(np.shape(U2)) for k in (-4, -2, 0, 2, 4)}
+        rows[0][..., 2:N+2] = 1
+        return diags_by_row(ghost_rows_1d(N, rows), N+4)
+
+    def step(self, U1, nstep: int = 1) -> np.ndarray:
+        """
+        陽的に nstep ステップ進めた解を返す
+        (equation の根を求めずに直接計算する)
+        """
+        N = self.settings['N']
+        Dx = self.settings['Dx']
+        Dt = self.settings['Dt']
+
+        U = np.array(U1, dtype=float)
+        self.ws = get_workspace(self.ws, np.shape(U))
+        C = self.ws.work[3][..., :N+2] # 化学ポテンシャル
+        L = self.ws.work[2][..., :N] # その差分
+        for _ in range(nstep):
+            lap(self.chem_func(U, out=C), out=L)
+            L *= Dt/Dx**2
+            U[..., 2:N+2] -= L
+            U[..., 0], U[..., 1] = U[..., 4], U[..., 3]
+            U[..., N+2], U[..., N+3] = U[..., N], U[..., N-1]
+        return U
+
     def mass(self, Utmp) -> float:
         """ 質量 """
         N = self.settings['N']
         Dx = self.settings['Dx']
 
-        output = (Utmp.sum() - Utmp[0]/2 - Utmp[N-1]/2) * Dx # cf. OFFY(2020)式(11)
+        output = (Utmp.sum(axis=-1) - Utmp[..., 0]/2 - Utmp[..., N-1]/2) * Dx # cf. OFFY(2020)式(11)
         return output
 
     def local_energy(self, Utmp) -> np.ndarray:
@@ -166,11 +364,10 @@ class CahnHilliardEq_NeumannBC_1d_FwdEuler():
         Gamma = self.params['Gamma']
         const = self.params['const']
 
-        # G = [0]*N
-        G = np.zeros(N)
-        for k in range(2, N+2):
-            i = k-2
-            G[i] = const*(Utmp[k]**4 - 2*Utmp[k]**2 + 1) + Gamma/4/(Dx**2)*((Utmp[k+1]-Utmp[k])**2 + (Utmp[k]-Utmp[k-1])**2)
+        # k = 2, ... , K+1 について一度に計算する
+        Uk = Utmp[..., 2:N+2]
+        dU = np.diff(Utmp[..., 1:N+3], axis=-1) # U[k+1] - U[k] (k = 1, ... , K+1)
+        G = const*(Uk**4 - 2*Uk**2 + 1) + Gamma/4/(Dx**2)*(dU[..., 1:]**2 + dU[..., :-1]**2)
         return G
 
     def energy(self, G: np.ndarray) -> float:
@@ -184,15 +381,181 @@ class CahnHilliardEq_NeumannBC_1d_FwdEuler():
         N = self.settings['N']
         Dx = self.settings['Dx']
 
-        output = (G.sum() - G[0]/2 - G[N-1]/2) * Dx
+        output = (G.sum(axis=-1) - G[..., 0]/2 - G[..., N-1]/2) * Dx
+        return output
+
+    def diagnostics(self, U) -> dict:
+        """ 仮想点込みの解 U の質量と離散全エネルギー (Diagnostics の既定値) """
+        N = self.settings['N']
+        return {
+            'mass': self.mass(U[..., 2:N+2]),
+            'energy': self.energy(self.local_energy(U)),
+        }
+
+class CahnHilliardEq_NeumannBC_2d_Spectral():
+    """
+    内部：Cahn-Hilliard 方程式 u_t = Lap(F'(u) - Gamma Lap u),  F(u) = const (u^2 - 1)^2
+    境界：斉次ノイマン (セル中心の格子, DCT-II で対角化する)
+    領域：2次元 (解は U[i, j] = u(x_i, y_j) の (Nx, Ny) 配列, 先頭の軸があればアンサンブル)
+
+    CahnHilliardEq_NeumannBC_1d_Stabilized と同じ安定化半陰的スキームを波数空間で解く
+    線形部分の係数行列は変換で対角になるので、1ステップは変換2回の O(N log N)
+    仮想点は持たない(境界条件は変換の選び方で入る)
+    """
+    bc = 'neumann' # Operator.to_spectral の境界の種類
+
+    def __init__(
+        self,
+        settings: dict = {
+            'Nx': 128, # x 方向の分割数
+            'Ny': 128, # y 方向の分割数
+            'Dx': 0.5, # x 方向の分割幅
+            'Dy': 0.5, # y 方向の分割幅 (省略時は Dx)
+            'Dt': 0.5, # 時間の分割幅
+        },
+        params: dict = {
+            'Gamma': 2, # 拡散項の係数
+            'const': 0.25, # 二重井戸型ポテンシャルの係数
+            'S': 2, # 安定化項の係数 (省略時は 8*const)
+        }
+    ):
+        self.settings = settings # space dimension
+        self.params = params # parameters
+        self.ws = None # 残差と作業用の配列 (Workspace)
+
+    def spacing(self) -> tuple:
+        """ (Dx, Dy) """
+        Dx = self.settings['Dx']
+        return (Dx, self.settings.get('Dy', Dx))
+
+    def stabilizer(self):
+        """ 安定化項の係数 S """
+        return self.params.get('S', 8*self.params['const'])
+
+    def symbol(self, shape: tuple) -> np.ndarray:
+        """ 離散ラプラシアンの固有値 (キャッシュされる) """
+        return laplacian_symbol(tuple(shape[-2:]), self.spacing(), self.bc)
+
+    def Laplacian(self, U) -> np.ndarray:
+        """ 5点差分ラプラシアン(境界条件込み)を U に作用させる """
+        shape = np.shape(U)[-2:]
+        return from_spectral(self.symbol(shape) * to_spectral(U, self.bc), shape, self.bc)
+
+    def chem_func(self, U1, U2) -> np.ndarray:
+        """ 化学ポテンシャル (1次元と同じく符号を反転したもの) """
+        Gamma = self.params['Gamma']
+        const = self.params['const']
+        S = self.stabilizer()
+
+        output = Gamma * self.Laplacian(U2) \
+            - S * (U2 - U1) \
+            - const * 4*(U1**3 - U1)
         return output
 
+    def equation(self, U2, U1) -> np.ndarray:
+        """ 方程式 (step の解で 0 になる) """
+        Dt = self.settings['Dt']
+        return U2 - U1 + Dt * self.Laplacian(self.chem_func(U1, U2))
+
+    def step(self, U1, nstep: int = 1) -> np.ndarray:
+        """
+        nstep ステップ進めた解を返す
+        波数空間では (1 + Dt (Gamma lam^2 - S lam)) V2 = (1 - Dt S lam) V1 + Dt lam F'(U1)^
+        (lam はラプラシアンの固有値, ^ は to_spectral)
+        """
+        Dt = self.settings['Dt']
+        Gamma = self.params['Gamma']
+        const = self.params['const']
+        S = self.stabilizer()
+        shape = np.shape(U1)[-2:]
+
+        lam = self.symbol(shape)
+        denom = 1 + Dt*(Gamma*lam**2 - S*lam)
+        lin = (1 - Dt*S*lam) / denom
+        nonlin = Dt*lam / denom
+
+        U = np.array(U1, dtype=float)
+        self.ws = get_workspace(self.ws, np.shape(U), nwork=1)
+        W = self.ws.work[0] # 非線形項 F'(U)
+        V = to_spectral(U, self.bc)
+        for _ in range(nstep):
+            # V は U の変換なので、毎ステップの変換は非線形項と逆変換の2回だけ
+            np.square(U, out=W)
+            W -= 1
+            W *= U
+            W *= const * 4
+            F = to_spectral(W, self.bc)
+            F *= nonlin
+            V *= lin
+            V += F
+            U = from_spectral(V, shape, self.bc)
+        return U
+
+    def mass(self, Utmp) -> float:
+        """ 質量 """
+        Dx, Dy = self.spacing()
+        return Utmp.sum(axis=(-2, -1)) * Dx*Dy
+
+    def local_energy(self, Utmp) -> np.ndarray:
+        """
+        離散局所エネルギー
+        勾配の項は各点に隣接する辺の差分の2乗の半分ずつ(1次元の local_energy と同じ配分)
+        """
+        Dx, Dy = self.spacing()
+        Gamma = self.params['Gamma']
+        const = self.params['const']
+
+        grad = 0
+        for axis, d in ((-2, Dx), (-1, Dy)):
+            if self.bc == 'periodic':
+                dU2 = (np.roll(Utmp, -1, axis=axis) - Utmp)**2
+                edge = dU2 + np.roll(dU2, 1, axis=axis)
+            else:
+                # 鏡映条件なので境界をまたぐ差分は 0
+                dU2 = np.diff(Utmp, axis=axis)**2
+                pad = [(0, 0)] * Utmp.ndim
+                pad[axis] = (1, 0)
+                edge = np.pad(dU2, pad)
+                pad[axis] = (0, 1)
+                edge = edge + np.pad(dU2, pad)
+            grad = grad + edge / d**2
+        G = const*(Utmp**2 - 1)**2 + Gamma/4*grad
+        return G
+
+    def energy(self, G: np.ndarray) -> float:
+        """
+        離散全エネルギー
+        Parameter
+        ---------
+        G: np.ndarray
+            離散局所エネルギー
+        """
+        Dx, Dy = self.spacing()
+        return G.sum(axis=(-2, -1)) * Dx*Dy
+
+    def diagnostics(self, U) -> dict:
+        """ 解 U の質量と離散全エネルギー (Diagnostics の既定値) """
+        return {
+            'mass': self.mass(U),
+            'energy': self.energy(self.local_energy(U)),
+        }
+
+class CahnHilliardEq_PeriodicBC_2d_Spectral(CahnHilliardEq_NeumannBC_2d_Spectral):
+    """
+    内部：Cahn-Hilliard 方程式
+    境界：周期境界 (実数 FFT で対角化する)
+    領域：2次元
+    スキームと診断量は CahnHilliardEq_NeumannBC_2d_Spectral と同じ
+    """
+    bc = 'periodic'
+
 class HeatEq_NeumannBC_1d_DVDM():
     """
     内部：熱方程式
     境界：斉次ノイマン
     領域：1次元
     """
+    linear = True # equation は U2 について線形 (system_matrix と rhs で直接解ける)
 
     def __init__(self, cfg_inst):
         """
@@ -231,33 +594,88 @@ class HeatEq_NeumannBC_1d_DVDM():
         self.cfg = cfg_inst
         self.settings = self.cfg.settings # space dimension
         self.params = self.cfg.params # parameters
+        self.ws = None # 残差と作業用の配列 (Workspace)
 
     def Laplacian(self, N) -> np.ndarray:
-        """ ラプラシアン """
-        output = np.zeros((N, N))
-        for k in range(1, N-1):
-            output[k, k-1:k+2] = [1, -2, 1]
-        return output
+        """ ラプラシアン(書き換えてよい密行列) """
+        return self.SparseLaplacian(N).toarray()
+
+    def SparseLaplacian(self, N):
+        """ ラプラシアン(キャッシュされた読み出し専用の疎行列) """
+        return laplacian(N, 'neumann')
 
-    def equation(self, U2, U1) -> list:
+    def equation(self, U2, U1) -> np.ndarray:
         """
         DVDM
         境界ぴったり
+        戻り値は作業領域の配列で、次の呼び出しで上書きされる(残す場合はコピーする)
         """
         N = self.settings['N']
         Dx = self.settings['Dx']
         Dt = self.settings['Dt']
         Gamma = self.params['Gamma']
 
-        Lap = self.Laplacian(N)
-
-        eq = [0]*(N)
-        eq[0] = U2[1]-U2[0] # eq[0] = - Gamma*(U1[1]-U1[0])/Dx
-        eq[1:N-1] = (U2[1:N-1]-U1[1:N-1])*Dx**2 - Gamma*0.5*np.dot(Lap, (U1+U2))[1:N-1]*Dt # (U2[1:N-1]-U1[1:N-1])/Dt - Gamma*np.dot(Lap, (U1+U2))[1:N-1]/(Dx**2)/2
-        eq[N-1] = U2[N-1]-U2[N-2] # eq[N-1] = + Gamma*(U1[N-1]-U1[N-2])/Dx
+        self.ws = get_workspace(self.ws, np.shape(U2))
+        eq = self.ws.eq
+        np.subtract(U2[..., 1], U2[..., 0], out=eq[..., 0]) # eq[0] = - Gamma*(U1[1]-U1[0])/Dx
+        self.inner_equation(U2, U1, eq)
+        np.subtract(U2[..., N-1], U2[..., N-2], out=eq[..., N-1]) # eq[N-1] = + Gamma*(U1[N-1]-U1[N-2])/Dx
 
         return eq
 
+    def inner_equation(self, U2, U1, eq):
+        """
+        内部の方程式 (U2[1:N-1]-U1[1:N-1])*Dx**2 - Gamma*0.5*lap(U1+U2)*Dt を eq[..., 1:N-1] に書き込む
+        (U2[1:N-1]-U1[1:N-1])/Dt - Gamma*lap(U1+U2)/(Dx**2)/2 に Dt*Dx**2 を掛けたもの
+        """
+        N = self.settings['N']
+        Dx = self.settings['Dx']
+        Dt = self.settings['Dt']
+        Gamma = self.params['Gamma']
+        Ssum = self.ws.work[0]
+        T = self.ws.work[1][..., 1:N-1]
+
+        inner = eq[..., 1:N-1]
+        np.add(U1, U2, out=Ssum)
+        lap(Ssum, out=inner)
+        inner *= -Gamma*0.5*Dt
+        np.subtract(U2[..., 1:N-1], U1[..., 1:N-1], out=T)
+        T *= Dx**2
+        inner += T
+
+    def jacobian(self, U2, U1):
+        """ 方程式の U2 についてのヤコビ行列(3重対角) """
+        N = self.settings['N']
+        Dx = self.settings['Dx']
+        Dt = self.settings['Dt']
+        Gamma = self.params['Gamma']
+
+        rows = {k: np.zeros(np.shape(U2)) for k in (-1, 0, 1)}
+        rows[-1][..., 1:N-1] = -Gamma*0.5*Dt
+        rows[0][..., 1:N-1] = Dx**2 + Gamma*Dt
+        rows[1][..., 1:N-1] = -Gamma*0.5*Dt
+        rows[0][..., 0], rows[1][..., 0] = -1, 1
+        rows[-1][..., N-1], rows[0][..., N-1] = -1, 1
+        return diags_by_row(rows, N)
+
+    def system_matrix(self, U1):
+        """
+        equation(U2, U1) = A U2 - b の係数行列 A (3重対角, 時間によらない)
+        U1 は形(アンサンブルのメンバー数)を決めるためだけに使う
+        """
+        return self.jacobian(U1, U1)
+
+    def rhs(self, U1) -> np.ndarray:
+        """ equation(U2, U1) = A U2 - b の右辺 b """
+        N = self.settings['N']
+        Dx = self.settings['Dx']
+        Dt = self.settings['Dt']
+        Gamma = self.params['Gamma']
+
+        b = np.zeros(np.shape(U1))
+        b[..., 1:N-1] = U1[..., 1:N-1]*Dx**2 + Gamma*0.5*lap(U1)*Dt
+        return b
+
 
 class HeatEq_ReactionBC_1d_DVDM():
     """
@@ -303,13 +721,15 @@ class HeatEq_ReactionBC_1d_DVDM():
         self.cfg = cfg_inst
         self.settings = self.cfg.settings # space dimension
         self.params = self.cfg.params # parameters
+        self.ws = None # 残差と作業用の配列 (Workspace)
 
     def Laplacian(self, N) -> np.ndarray:
-        """ ラプラシアン """
-        output = np.zeros((N, N))
-        for k in range(1, N-1):
-            output[k, k-1:k+2] = [1, -2, 1]
-        return output
+        """ ラプラシアン(書き換えてよい密行列) """
+        return self.SparseLaplacian(N).toarray()
+
+    def SparseLaplacian(self, N):
+        """ ラプラシアン(キャッシュされた読み出し専用の疎行列) """
+        return laplacian(N, 'neumann')
     
     def Delx(self, Ubd, Uin):
         """ 法線微分(向きも考慮されている) """
@@ -328,19 +748,73 @@ class HeatEq_ReactionBC_1d_DVDM():
         )
         return output
 
-    def equation(self, U2, U1) -> list:
-        """ 方程式 """
+    def equation(self, U2, U1) -> np.ndarray:
+        """
+        方程式
+        戻り値は作業領域の配列で、次の呼び出しで上書きされる(残す場合はコピーする)
+        """
         N = self.settings['N']
         Dx = self.settings['Dx']
         Dt = self.settings['Dt']
         Gamma = self.params['Gamma']
 
-        Lap = self.Laplacian(N)
+        self.ws = get_workspace(self.ws, np.shape(U2))
+        eq = self.ws.eq
+        # 係数が配列(アンサンブル計算)でも形がそろうように境界はスライスで取る
+        bd0, in0 = (..., slice(0, 1)), (..., slice(1, 2))
+        bd1, in1 = (..., slice(N-1, N)), (..., slice(N-2, N-1))
 
-        eq = [0]*(N)
-
-        eq[0] = (U2[0]-U1[0])*Dx - self.Reaction(U2[0], U1[0])*Dt*Dx + Gamma*0.5*(self.Delx(Ubd=U2[0]+U1[0], Uin=U2[1]+U1[1]))*Dt
-        eq[1:N-1] = (U2[1:N-1]-U1[1:N-1])*Dx**2 - Gamma*0.5*np.dot(Lap, (U1+U2))[1:N-1]*Dt # (U2[1:N-1]-U1[1:N-1])/Dt - Gamma*np.dot(Lap, (U1+U2))[1:N-1]/(Dx**2)/2
-        eq[N-1] = (U2[N-1]-U1[N-1])*Dx - self.Reaction(U2[N-1], U1[N-1])*Dt*Dx + Gamma*0.5*(self.Delx(Ubd=U2[N-1]+U1[N-1], Uin=U2[N-2]+U1[N-2]))*Dt
+        # 境界は各メンバー1点ずつなのでそのまま計算する
+        eq[bd0] = (U2[bd0]-U1[bd0])*Dx - self.Reaction(U2[bd0], U1[bd0])*Dt*Dx + Gamma*0.5*(self.Delx(Ubd=U2[bd0]+U1[bd0], Uin=U2[in0]+U1[in0]))*Dt
+        self.inner_equation(U2, U1, eq)
+        eq[bd1] = (U2[bd1]-U1[bd1])*Dx - self.Reaction(U2[bd1], U1[bd1])*Dt*Dx + Gamma*0.5*(self.Delx(Ubd=U2[bd1]+U1[bd1], Uin=U2[in1]+U1[in1]))*Dt
 
         return eq
+
+    def inner_equation(self, U2, U1, eq):
+        """
+        内部の方程式 (U2[1:N-1]-U1[1:N-1])*Dx**2 - Gamma*0.5*lap(U1+U2)*Dt を eq[..., 1:N-1] に書き込む
+        (U2[1:N-1]-U1[1:N-1])/Dt - Gamma*lap(U1+U2)/(Dx**2)/2 に Dt*Dx**2 を掛けたもの
+        """
+        N = self.settings['N']
+        Dx = self.settings['Dx']
+        Dt = self.settings['Dt']
+        Gamma = self.params['Gamma']
+        Ssum = self.ws.work[0]
+        T = self.ws.work[1][..., 1:N-1]
+
+        inner = eq[..., 1:N-1]
+        np.add(U1, U2, out=Ssum)
+        lap(Ssum, out=inner)
+        inner *= -Gamma*0.5*Dt
+        np.subtract(U2[..., 1:N-1], U1[..., 1:N-1], out=T)
+        T *= Dx**2
+        inner += T
+
+    def dReaction(self, U2, U1):
+        """ 反応項の U2 についての微分 """
+        const = self.params['const']
+
+        output = const * (
+            (3*U2**2 + 2*U2*U1 + U1**2)
+            - 1
+        )
+        return output
+
+    def jacobian(self, U2, U1):
+        """ 方程式の U2 についてのヤコビ行列(3重対角) """
+        N = self.settings['N']
+        Dx = self.settings['Dx']
+        Dt = self.settings['Dt']
+        Gamma = self.params['Gamma']
+
+        rows = {k: np.zeros(np.shape(U2)) for k in (-1, 0, 1)}
+        rows[-1][..., 1:N-1] = -Gamma*0.5*Dt
+        rows[0][..., 1:N-1] = Dx**2 + Gamma*Dt
+        rows[1][..., 1:N-1] = -Gamma*0.5*Dt
+        for k, kin in ((0, 1), (N-1, N-2)):
+            bd = (..., slice(k, k+1))
+            rows[0][bd] = Dx - self.dReaction(U2[bd], U1[bd])*Dt*Dx - Gamma*0.5*Dt
+            rows[kin-k][bd] = Gamma*0.5*Dt
+        return diags_by_row(rows, N)
+
@@ -0,0 +1,145 @@
+import numpy as np
+
+from .Profiler import Observer
+
+def interface_count(U, level: float = 0.0) -> int:
+    """ U - level の符号が隣の格子点と変わる箇所の数 (相分離の界面の数) """
+    s = np.signbit(np.asarray(U) - level)
+    return int(sum(np.count_nonzero(np.diff(s, axis=axis)) for axis in range(s.ndim)))
+
+class Monitor(Observer):
+    """
+    時間発展の途中で条件を調べて、満たされたら計算を止める(または保存間隔を切り替える)監視者の雛形
+    サブクラスは check(calc, info) で (条件を満たしたか, 値) を返す
+    Calc1d.calc(observers=[...]) に渡す
+
+    条件を満たしたときの記録は calc.events に追加され、計算の最後に {output_dir}/events.json に書かれる
+    """
+    name = 'monitor'
+
+    def __init__(self, stop: bool = True, brank: int = None, every: int = 0, patience: int = 1):
+        """
+        Parameter
+        ---------
+        stop: bool
+            条件を満たしたら計算を止める(止めた時刻の解は保存される)
+        brank: int
+            条件を満たしたら解を保存するステップ間隔をこの値に切り替える
+        every: int
+            0 なら解を保存する時刻ステップごと、正ならこのステップ数ごとに調べる
+        patience: int
+            この回数続けて条件を満たしたら動作する
+        """
+        self.stop = stop
+        self.brank = brank
+        self.every = every
+        self.patience = patience
+
+    def check(self, calc, info: dict):
+        raise NotImplementedError
+
+    def due(self, t: int, saved: bool) -> bool:
+        """ 時刻ステップ t で調べるか """
+        if self.every > 0:
+            return t - self.last >= self.every
+        return saved
+
+    def start(self, calc, t: int, U):
+        self.last = t # 最後に調べた時刻ステップ
+        self.count = 0 # 続けて条件を満たした回数
+        self.value = None # 最後に調べた値
+        self.done = False
+
+    def step(self, calc, info: dict):
+        t = info['t']
+        if self.done or not self.due(t, info['saved']):
+            return
+        self.last = t
+        hit, self.value = self.check(calc, info)
+        self.count = self.count+1 if hit else 0
+        if self.count >= self.patience:
+            self.fire(calc, t)
+
+    def fire(self, calc, t: int):
+        """ 条件を満たしたときの動作 """
+        self.done = True
+        calc.events.append({
+            't': t,
+            'time': t*calc.settings['Dt'],
+            'monitor': self.name,
+            'value': self.value,
+            'stop': self.stop,
+            'brank': self.brank,
+        })
+        if self.brank is not None:
+            calc.brank = self.brank
+        if self.stop:
+            calc.request_stop(f'{self.name}={self.value}')
+
+class DerivativeMonitor(Monitor):
+    """ ||dU/dt|| が tol 以下になったら定常とみなす """
+    name = 'dUdt'
+
+    def __init__(self, tol: float, ord=np.inf, **kwargs):
+        """
+        tol: 時間差分 (U2-U1)/Dt のノルムの閾値
+        ord: ノルムの種類 (np.linalg.norm の ord)
+        """
+        super().__init__(**kwargs)
+        self.tol = tol
+        self.ord = ord
+
+    def check(self, calc, info: dict):
+        dUdt = (info['U'] - info['Uprev']) / calc.settings['Dt']
+        value = float(np.linalg.norm(dUdt.ravel(), self.ord))
+        return value <= self.tol, value
+
+class EnergyMonitor(Monitor):
+    """
+    エネルギーの変化が止まったら定常とみなす
+    前に調べた時刻からの単位時間あたりの変化 |E2-E1|/(t2-t1) が rtol*|E2| + atol 以下で条件を満たす
+    """
+    name = 'energy'
+
+    def __init__(self, energy, rtol: float = 1e-8, atol: float = 0.0, **kwargs):
+        """
+        energy: 方程式クラスのインスタンス (energy(local_energy(U)) を使う) か、U を受け取ってエネルギーを返す関数
+            EX) EnergyMonitor(ch), EnergyMonitor(lambda U: ch.energy(ch.local_energy(U)))
+        """
+        super().__init__(**kwargs)
+        if hasattr(energy, 'local_energy'):
+            # 方程式クラスの energy は U ではなく局所エネルギー G を受け取る
+            eq_inst = energy
+            energy = lambda U: eq_inst.energy(eq_inst.local_energy(U))
+        self.energy = energy
+        self.rtol = rtol
+        self.atol = atol
+
+    def start(self, calc, t: int, U):
+        super().start(calc, t, U)
+        self.previous = (t, float(self.energy(U)))
+
+    def check(self, calc, info: dict):
+        t, E = info['t'], float(self.energy(info['U']))
+        t1, E1 = self.previous
+        self.previous = (t, E)
+        value = abs(E - E1) / ((t - t1)*calc.settings['Dt'])
+        return value <= self.rtol*abs(E) + self.atol, value
+
+class PredicateMonitor(Monitor):
+    """
+    U を受け取る関数 func が真を返したら条件を満たす
+    EX) 界面が2つ以下になったら止める
+        PredicateMonitor(lambda U: interface_count(U[2:-2]) <= 2)
+    """
+    name = 'predicate'
+
+    def __init__(self, func, name: str = None, **kwargs):
+        super().__init__(**kwargs)
+        self.func = func
+        if name is not None:
+            self.name = name
+
+    def check(self, calc, info: dict):
+        hit = bool(self.func(info['U']))
+        return hit, hit
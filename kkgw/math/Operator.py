@@ -0,0 +1,138 @@
+import functools
+
+import numpy as np
+
+# scipy.sparse と scipy.fft は使うときに読み込む(起動の速さのため)
+
+def lap(U, out=None) -> np.ndarray:
+    """
+    2階中心差分 U[k-1] - 2U[k] + U[k+1]
+    スライスで計算するので出力は最後の軸で長さが 2 短くなる
+    out を渡すと新しい配列を作らずにそこへ書き込む
+    """
+    if out is None:
+        return U[..., :-2] - 2*U[..., 1:-1] + U[..., 2:]
+    np.multiply(U[..., 1:-1], -2, out=out)
+    out += U[..., :-2]
+    out += U[..., 2:]
+    return out
+
+class Workspace():
+    """
+    方程式の残差と途中計算の配列をまとめて確保しておき、呼び出しのたびに使い回す
+    ソルバーの反復の中で equation を何度呼んでも新しい配列は作らない
+    """
+    __slots__ = ('shape', 'eq', 'work')
+
+    def __init__(self, shape: tuple, nwork: int = 4):
+        self.shape = tuple(shape) # 解の形 (先頭の軸があればアンサンブル)
+        self.eq = np.zeros(self.shape) # 残差
+        self.work = tuple(np.zeros(self.shape) for _ in range(nwork)) # 作業用 (スライスして使う)
+
+def get_workspace(ws, shape: tuple, nwork: int = 4) -> Workspace:
+    """ ws が形 shape の作業領域ならそのまま返し、違えば(または None なら)確保し直す """
+    if ws is None or ws.shape != tuple(shape) or len(ws.work) < nwork:
+        ws = Workspace(shape, nwork)
+    return ws
+
+@functools.lru_cache(maxsize=None)
+def laplacian(N: int, bc: str = 'ghost'):
+    """
+    離散ラプラシアン(疎行列)
+    (N, bc) ごとに一度だけ作ってキャッシュする
+    Parameter
+    ---------
+    N: int
+        出力の点数
+    bc: str
+        'ghost': 両端の仮想点込みの長さ N+2 の入力に作用する (N, N+2) 行列
+        'neumann': 両端の行がゼロの (N, N) 行列
+    """
+    from scipy import sparse
+
+    if bc == 'ghost':
+        output = sparse.diags([1., -2., 1.], [0, 1, 2], shape=(N, N+2), format='csr')
+    elif bc == 'neumann':
+        rows = {k: np.zeros(N) for k in (-1, 0, 1)}
+        rows[-1][1:N-1], rows[0][1:N-1], rows[1][1:N-1] = 1, -2, 1
+        output = diags_by_row(rows, N)
+    else:
+        raise ValueError(f'unknown boundary type: {bc}')
+    output.data.setflags(write=False) # キャッシュを書き換えられないように
+    return output
+
+def diags_by_row(rows: dict, n: int):
+    """
+    行ごとに並べた対角成分から疎行列を作る
+    Parameter
+    ---------
+    rows: dict
+        {オフセット k: 最後の軸の長さが n の配列} で、[..., i] が (i, i+k) 成分
+        先頭の軸があれば各ブロックを並べたブロック対角行列になる
+    """
+    from scipy import sparse
+
+    offsets = sorted(rows)
+    shape = np.broadcast_shapes(*(np.shape(rows[k]) for k in offsets))
+    M = int(np.prod(shape[:-1])) # ブロックの数
+    idx = np.arange(n)
+    data = []
+    for k in offsets:
+        row = np.array(np.broadcast_to(rows[k], shape), dtype=float)
+        row[..., (idx+k < 0) | (idx+k >= n)] = 0 # 隣のブロックにはみ出す成分
+        row = row.reshape(-1)
+        data.append(row[:M*n-k] if k >= 0 else row[-k:])
+    return sparse.diags(data, offsets, shape=(M*n, M*n), format='csr')
+
+def ghost_rows_1d(N, rows: dict):
+    """ 仮想点 k = 0, 1, N+2, N+3 の鏡映条件の行を追加する """
+    rows[0][..., [0, 1, N+2, N+3]] = 1
+    rows[4][..., 0] = -1
+    rows[2][..., 1] = -1
+    rows[-2][..., N+2] = -1
+    rows[-4][..., N+3] = -1
+    return rows
+
+@functools.lru_cache(maxsize=None)
+def laplacian_symbol(shape: tuple, spacing: tuple, bc: str = 'neumann') -> np.ndarray:
+    """
+    5点差分ラプラシアンの固有値(キャッシュされる)
+    to_spectral の係数と同じ並びなので、掛けるだけでラプラシアンが作用する
+    Parameter
+    ---------
+    shape: tuple
+        格子点数 (Nx, Ny)
+    spacing: tuple
+        分割幅 (Dx, Dy)
+    bc: str
+        'neumann': セル中心の格子で斉次ノイマン (DCT-II)
+        'periodic': 周期境界 (実数 FFT, 最後の軸は Ny//2+1 個)
+    """
+    output = 0
+    for axis, (n, d) in enumerate(zip(shape, spacing)):
+        if bc == 'neumann':
+            theta = np.pi * np.arange(n) / (2*n)
+        elif bc == 'periodic':
+            k = np.fft.rfftfreq(n) if axis == len(shape)-1 else np.fft.fftfreq(n)
+            theta = np.pi * k
+        else:
+            raise ValueError(f'unknown boundary type: {bc}')
+        lam = -4/d**2 * np.sin(theta)**2
+        output = output + lam.reshape((-1,) + (1,)*(len(shape)-1-axis))
+    output = np.array(output, dtype=float)
+    output.setflags(write=False) # キャッシュを書き換えられないように
+    return output
+
+def to_spectral(U, bc: str = 'neumann', workers: int = None) -> np.ndarray:
+    """ 最後の2軸の DCT-II (斉次ノイマン) または実数 FFT (周期境界) """
+    from scipy import fft
+    if bc == 'neumann':
+        return fft.dctn(U, type=2, axes=(-2, -1), norm='ortho', workers=workers)
+    return fft.rfftn(U, axes=(-2, -1), workers=workers)
+
+def from_spectral(V, shape: tuple, bc: str = 'neumann', workers: int = None) -> np.ndarray:
+    """ to_spectral の逆変換 (shape は最後の2軸の格子点数) """
+    from scipy import fft
+    if bc == 'neumann':
+        return fft.idctn(V, type=2, axes=(-2, -1), norm='ortho', workers=workers)
+    return fft.irfftn(V, s=shape, axes=(-2, -1), workers=workers)
@@ -0,0 +1,256 @@
+import copy
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+from .Simulation import Calc1d
+from .Solver import NewtonSolver, banded_lu, lu_solve, maxabs
+from .Storage import TrajectoryStore
+from .Sweep import process_pool
+
+def make_solver(solver):
+    """ 'newton': NewtonSolver(), 'chord': NewtonSolver(chord=True), None: optimize.root """
+    if solver is None or isinstance(solver, NewtonSolver):
+        return solver
+    return NewtonSolver(chord=(solver == 'chord'))
+
+def propagate(equation, U, nstep: int, solver=None, callback=None) -> np.ndarray:
+    """
+    方程式クラスの equation のスキームで U から nstep ステップ進めた解
+    Calc1d.calc と同じく陽的スキームは step、線形スキームは LU 分解の使い回し、それ以外は solver で解く
+    callback(k, U2, U1) は k ステップ目の後に呼ばれる(陽的スキームでも1ステップずつ進める)
+    """
+    eq_inst = equation.__self__
+    U1 = np.array(U, dtype=float)
+    if hasattr(eq_inst, 'step') and callback is None:
+        return eq_inst.step(U1, nstep) if nstep > 0 else U1
+
+    linear = getattr(eq_inst, 'linear', False)
+    lu = None
+    jac = None
+    if hasattr(eq_inst, 'jacobian'):
+        jac = lambda U2, U1: eq_inst.jacobian(U2, U1).toarray()
+    if solver is not None:
+        solver.reset()
+    for k in range(1, nstep+1):
+        if hasattr(eq_inst, 'step'):
+            U2 = eq_inst.step(U1)
+        elif linear:
+            if lu is None:
+                lu = banded_lu(eq_inst.system_matrix(U1))
+            U2 = lu_solve(lu, eq_inst.rhs(U1))
+        elif solver is not None:
+            U2 = solver.solve(equation, eq_inst.jacobian, U1).x
+        else:
+            from scipy import optimize
+            U2 = optimize.root(equation, U1, args=U1, method="hybr", jac=jac).x
+        if callback is not None:
+            callback(k, U2, U1)
+        U1 = U2
+    return U1
+
+def _fine(task: dict) -> dict:
+    """
+    1つの時間区間の細かい伝播(ワーカープロセスで実行される)
+    区間内の保存点の解と時間差分を {output_slice}/U, dUdt の TrajectoryStore に書く
+    """
+    start = time.process_time() # 他のプロセスと CPU を取り合っても変わらないように CPU 時間で測る
+    cfg = task['cfg']
+    Dt = cfg.settings['Dt']
+    inittime = cfg.timeset['inittime']
+    endtime = inittime + cfg.timeset['timespan']
+    brank = cfg.timeset['brank']
+    t0 = task['t0']
+
+    stores = {varname: TrajectoryStore(task['output_slice'], varname) for varname in ('U', 'dUdt')}
+    for store in stores.values():
+        store.clear()
+
+    def save(k, U2, U1):
+        t = t0 + k
+        if t%brank==0 or t==(inittime+1) or t==endtime:
+            stores['U'].append(t, t*Dt, U2)
+            stores['dUdt'].append(t, t*Dt, (U2-U1)/Dt)
+
+    try:
+        U = propagate(task['make_equation'](cfg), task['U'], task['t1'] - t0, make_solver(task['solver']), save)
+    finally:
+        for store in stores.values():
+            store.close()
+    return {'index': task['index'], 'U': U, 'elapsed': time.process_time() - start}
+
+def slice_bounds(inittime: int, timespan: int, nslices: int, ratio: float) -> list:
+    """
+    [inittime, inittime+timespan] を nslices 個の区間に分ける境界の時刻ステップ
+    ratio: 粗い時間刻み幅 / Dt (各区間の長さがこの倍数になるようにする)
+    """
+    bounds = [inittime + round(i*timespan/nslices) for i in range(nslices+1)]
+    # coarse_dt/Dt は割り算の丸め誤差で整数からずれる (0.07/0.01 = 7.000000000000001 など)
+    r = round(ratio)
+    if r >= 1 and abs(ratio - r) <= 1e-9*r:
+        bounds = [inittime + r*round((b-inittime)/r) for b in bounds]
+        bounds[-1] = inittime + timespan
+    return sorted(set(bounds))
+
+def parareal(
+    cfg_inst,
+    make_fine,
+    make_coarse,
+    coarse_dt: float = None,
+    nslices: int = None,
+    max_workers: int = None,
+    tol: float = 1e-8,
+    maxiter: int = None,
+    solver: str = 'newton',
+    coarse_solver: str = 'newton',
+    keep_slices: bool = False,
+) -> dict:
+    """
+    パラリアル法で時間方向に並列に計算する
+    時間を nslices 個の区間に分け、安い粗い伝播 G を逐次に、細かい伝播 F (本番のスキーム) を各区間で並列に進めて
+    U[n+1] = G(U[n]) + F(U_old[n]) - G(U_old[n]) を区間の境界の解の変化が tol 以下になるまで繰り返す
+    k 回目の反復で最初の k 区間は確定するので、F はまだ確定していない区間だけ計算し直す
+
+    収束した細かい解の保存点は Calc1d.calc と同じ {output_dir}/var の TrajectoryStore に書く
+    Calc1d.preparation で初期値を保存した後に呼ぶ
+
+    make_fine(cfg), make_coarse(cfg) は Sweep と同じく cfg から方程式クラスの equation メソッドを作る関数
+    (make_coarse には settings['Dt'] を coarse_dt に書き換えた cfg を渡す)
+    EX) 粗い伝播に CahnHilliardEq_NeumannBC_1d_Stabilized や大きな Dt の DVDM を使う
+
+    Parameter
+    ---------
+    coarse_dt: float
+        粗い伝播の時間刻み幅 (省略時は 10*Dt)
+    nslices: int
+        時間区間の数 (省略時は max_workers か CPU 数)
+    tol: float
+        区間の境界の解の変化の相対許容誤差 (最大値ノルム)
+    maxiter: int
+        最大反復回数 (省略時は nslices、このとき結果は逐次計算と一致する)
+    solver, coarse_solver: str
+        None: optimize.root, 'newton': NewtonSolver(), 'chord': NewtonSolver(chord=True)
+    keep_slices: bool
+        各区間の細かい解 {output_dir}/parareal/slice=*** を消さずに残す
+    Return
+    ------
+    反復の記録と並列化の効果 ({output_dir}/parareal.json にも書く)
+    """
+    start = time.perf_counter()
+    Dt = cfg_inst.settings['Dt']
+    inittime = cfg_inst.timeset['inittime']
+    timespan = cfg_inst.timeset['timespan']
+    max_workers = os.cpu_count() if max_workers is None else max_workers
+    nslices = max_workers if nslices is None else nslices
+    coarse_dt = 10*Dt if coarse_dt is None else coarse_dt
+
+    # 粗い伝播
+    cfg_coarse = copy.deepcopy(cfg_inst)
+    cfg_coarse.settings = dict(cfg_inst.settings, Dt=coarse_dt)
+    coarse = make_coarse(cfg_coarse)
+    coarse_solver = make_solver(coarse_solver)
+    bounds = slice_bounds(inittime, timespan, nslices, coarse_dt/Dt)
+    nslices = len(bounds) - 1
+    ncoarse = []
+    for t0, t1 in zip(bounds[:-1], bounds[1:]):
+        n = (t1-t0)*Dt/coarse_dt
+        if abs(n - round(n)) > 1e-9 or round(n) < 1:
+            raise ValueError(f'slice [{t0}, {t1}] is not a multiple of coarse_dt={coarse_dt}')
+        ncoarse.append(round(n))
+    G = lambda n, U: propagate(coarse, U, ncoarse[n], coarse_solver)
+    maxiter = nslices if maxiter is None else maxiter
+
+    calc = Calc1d(cfg_inst)
+    output_parareal = os.path.join(calc.output_dir, 'parareal')
+    output_slices = [os.path.join(output_parareal, f'slice={n:03d}') for n in range(nslices)]
+    for path in output_slices:
+        os.makedirs(path, exist_ok=True)
+
+    # 0回目: 粗い伝播だけで区間の境界の解を作る
+    tic = time.perf_counter()
+    U = [calc.load(inittime)]
+    Gold = []
+    for n in range(nslices):
+        Gold.append(G(n, U[n]))
+        U.append(Gold[n])
+    calc.close_stores()
+    coarse_time = time.perf_counter() - tic
+
+    history = []
+    fine_time = np.zeros(nslices) # 各区間の最後の細かい伝播の CPU 時間
+    F = [None] * nslices
+    with process_pool(min(max_workers, nslices)) as executor:
+        for k in range(maxiter):
+            tic = time.perf_counter()
+            tasks = [{
+                'index': n,
+                'cfg': cfg_inst,
+                'make_equation': make_fine,
+                'solver': solver,
+                't0': bounds[n],
+                't1': bounds[n+1],
+                'U': U[n],
+                'output_slice': output_slices[n],
+            } for n in range(k, nslices)]
+            for result in executor.map(_fine, tasks):
+                F[result['index']] = result['U']
+                fine_time[result['index']] = result['elapsed']
+            tfine = time.perf_counter() - tic
+
+            # 粗い伝播で補正しながら境界の解を更新する (区間 k までは確定している)
+            tic = time.perf_counter()
+            change = 0.0
+            for n in range(k, nslices):
+                if n == k:
+                    Unew = F[n]
+                else:
+                    Gnew = G(n, U[n])
+                    Unew = Gnew + F[n] - Gold[n]
+                    Gold[n] = Gnew
+                change = max(change, maxabs(Unew - U[n+1]) / (1 + maxabs(Unew)))
+                U[n+1] = Unew
+            tcoarse = time.perf_counter() - tic
+            coarse_time += tcoarse
+
+            history.append({'iteration': k+1, 'change': float(change), 'fine': tfine, 'coarse': tcoarse, 'slices': nslices - k})
+            print(f'parareal k={k+1}: change={change:.3e}, fine {tfine:.2f}s, coarse {tcoarse:.2f}s')
+            if change <= tol or k+1 == nslices:
+                break
+
+    # 各区間の保存点を1つの TrajectoryStore にまとめる
+    for varname in ('U', 'dUdt'):
+        store = calc.store(varname)
+        store.truncate(inittime)
+        for path in output_slices:
+            with TrajectoryStore(path, varname) as part:
+                steps, times, data = part.window()
+                for step, t, value in zip(steps, times, data):
+                    store.append(int(step), float(t), value)
+    calc.close_stores()
+    if not keep_slices:
+        shutil.rmtree(output_parareal, ignore_errors=True)
+
+    # 逐次に細かく計算したときの時間は各区間の細かい伝播の時間の和で見積もる
+    wall = time.perf_counter() - start
+    serial = float(fine_time.sum())
+    report = {
+        'nslices': nslices,
+        'workers': min(max_workers, nslices),
+        'iterations': len(history),
+        'converged': bool(history[-1]['change'] <= tol or len(history) == nslices),
+        'bounds': bounds,
+        'coarse_dt': coarse_dt,
+        'wall': wall,
+        'coarse': coarse_time,
+        'serial_estimate': serial,
+        'speedup': serial / wall,
+        'efficiency': serial / wall / min(max_workers, nslices),
+        'history': history,
+    }
+    with open(os.path.join(calc.output_dir, 'parareal.json'), 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"parareal: {report['iterations']} iterations, wall {wall:.2f}s, serial estimate {serial:.2f}s, speedup {report['speedup']:.2f}")
+    return report
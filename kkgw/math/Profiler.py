@@ -0,0 +1,198 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+
+class Observer():
+    """
+    Calc1d.calc(observers=[...]) に渡す観測者の雛形
+    start と finish は計算の最初と最後(例外で止まったときも)に、step は各ステップの後に呼ばれる
+
+    step に渡す info の中身
+    ======
+    't': 時刻ステップ, 'nstep': まとめて進めたステップ数 (fuse のとき 2 以上)
+    'wall': このステップ全体の時間[秒], 'solve': 求解の時間, 'io': 保存・Diagnostics・チェックポイントの時間
+    'success': 収束したか, 'nit': 反復回数, 'nfev': 残差の評価回数, 'njev': ヤコビ行列の評価回数
+    'residual': 残差の最大値ノルム (陽的・線形スキームでは None), 'message': ソルバーのメッセージ
+    'saved': この時刻ステップで解を保存したか, 'U': 新しい解, 'Uprev': 1ステップ前の解 (どちらも書き換えないこと)
+    """
+
+    def start(self, calc, t: int, U):
+        pass
+
+    def step(self, calc, info: dict):
+        pass
+
+    def finish(self, calc):
+        pass
+
+class Instrumentation(Observer):
+    """
+    各ステップの時間とソルバーの統計を記録して、最後にまとめを出す
+    収束しなかったステップは on_failure に従って警告する
+
+    calc.calc(equation, solver=solver, observers=[inst])
+    print(inst.report())
+    """
+    FIELDS = ('t', 'nstep', 'wall', 'solve', 'io', 'success', 'nit', 'nfev', 'njev', 'residual')
+
+    def __init__(self, on_failure: str = 'warn', save: bool = True, verbose: bool = True):
+        """
+        Parameter
+        ---------
+        on_failure: str
+            'warn': warnings.warn, 'raise': RuntimeError で止める, 'ignore': 記録だけ
+        save: bool
+            計算の最後に {output_dir}/instrument.json (まとめ) と instrument.npz (各ステップ) を書く
+        verbose: bool
+            計算の最後にまとめを表示する
+        """
+        self.on_failure = on_failure
+        self.save = save
+        self.verbose = verbose
+        self.records = {key: [] for key in self.FIELDS}
+        self.failures = [] # (時刻ステップ, メッセージ)
+        self.started = None # start が呼ばれた時刻 (None のまま finish が呼ばれたら時間は測らない)
+        self.elapsed = None
+
+    def start(self, calc, t: int, U):
+        self.started = time.perf_counter()
+
+    def step(self, calc, info: dict):
+        for key in self.FIELDS:
+            value = info[key]
+            self.records[key].append(np.nan if value is None else value)
+        if not info['success']:
+            self.failures.append((info['t'], info['message']))
+            message = f"step {info['t']}: solver did not converge ({info['message']}), residual={info['residual']}"
+            if self.on_failure == 'raise':
+                raise RuntimeError(message)
+            if self.on_failure == 'warn':
+                warnings.warn(message, RuntimeWarning)
+
+    def finish(self, calc):
+        # 前の観測者の start が例外を出したときも呼ばれるので、元の例外を隠さないようにする
+        if self.started is not None:
+            self.elapsed = time.perf_counter() - self.started
+        if self.save:
+            with open(os.path.join(calc.output_dir, 'instrument.json'), 'w') as f:
+                json.dump(self.summary(), f, indent=2)
+            np.savez(os.path.join(calc.output_dir, 'instrument.npz'), **self.arrays())
+        if self.verbose:
+            print(self.report())
+
+    def arrays(self) -> dict:
+        """ 各ステップの記録 {項目: 配列} """
+        return {key: np.asarray(values) for key, values in self.records.items()}
+
+    def summary(self) -> dict:
+        """ 記録のまとめ """
+        a = self.arrays()
+        nstep = int(a['nstep'].sum())
+        output = {
+            'steps': nstep,
+            'elapsed': float(a['wall'].sum()) if self.elapsed is None else self.elapsed,
+            'wall': float(a['wall'].sum()),
+            'solve': float(a['solve'].sum()),
+            'io': float(a['io'].sum()),
+            'failures': len(self.failures),
+            'failed_steps': [t for t, _ in self.failures[:100]],
+        }
+        if len(a['t']) > 0:
+            output.update({
+                'wall_per_step': output['wall'] / max(nstep, 1),
+                'wall_max': float(a['wall'].max()),
+                'wall_max_step': int(a['t'][a['wall'].argmax()]),
+                'nit_mean': float(a['nit'].mean()),
+                'nit_max': int(a['nit'].max()),
+                'nfev': int(a['nfev'].sum()),
+                'njev': int(a['njev'].sum()),
+                'residual_max': None if np.isnan(a['residual']).all() else float(np.nanmax(a['residual'])),
+            })
+        return output
+
+    def report(self) -> str:
+        """ まとめの表示用の文字列 """
+        s = self.summary()
+        lines = [f"steps={s['steps']}, elapsed={s['elapsed']:.3f}s"]
+        if s['wall'] > 0:
+            lines.append(
+                f"  solve {s['solve']:.3f}s ({100*s['solve']/s['wall']:.1f}%), "
+                f"io {s['io']:.3f}s ({100*s['io']/s['wall']:.1f}%)"
+            )
+        if 'nit_mean' in s:
+            lines.append(
+                f"  per step {1e3*s['wall_per_step']:.3f}ms (max {1e3*s['wall_max']:.3f}ms at t={s['wall_max_step']}), "
+                f"nit mean {s['nit_mean']:.2f} max {s['nit_max']}, nfev {s['nfev']}, njev {s['njev']}"
+            )
+            if s['residual_max'] is not None:
+                lines.append(f"  max residual {s['residual_max']:.3e}")
+        lines.append(f"  failures {s['failures']}" + (f" at t={s['failed_steps'][:10]}" if s['failures'] else ''))
+        return '\n'.join(lines)
+
+class ProfileWindow(Observer):
+    """
+    時刻ステップ start の後から stop までだけ cProfile と tracemalloc を動かす
+    結果は {output_dir}/profile/steps={start}-{stop}.prof (cProfile) と .txt (上位の関数とメモリ確保) に書く
+    """
+
+    def __init__(self, start: int, stop: int, cprofile: bool = True, memory: bool = True, top: int = 20):
+        self.start_step = start
+        self.stop_step = stop
+        self.cprofile = cprofile
+        self.memory = memory
+        self.top = top
+        self.profiler = None
+        self.active = False
+        self.done = False
+
+    def start(self, calc, t: int, U):
+        if self.start_step <= t < self.stop_step:
+            self._enable()
+
+    def step(self, calc, info: dict):
+        t = info['t']
+        if not self.active and not self.done and self.start_step <= t < self.stop_step:
+            self._enable()
+        elif self.active and t >= self.stop_step:
+            self._disable(calc)
+
+    def finish(self, calc):
+        if self.active:
+            self._disable(calc)
+
+    def _enable(self):
+        self.active = True
+        if self.memory:
+            tracemalloc.start()
+        if self.cprofile:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def _disable(self, calc):
+        self.active = False
+        self.done = True
+        output_profile = os.path.join(calc.output_dir, 'profile')
+        os.makedirs(output_profile, exist_ok=True)
+        name = os.path.join(output_profile, f'steps={self.start_step}-{self.stop_step}')
+
+        text = io.StringIO()
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(name + '.prof')
+            pstats.Stats(self.profiler, stream=text).sort_stats('cumulative').print_stats(self.top)
+        if self.memory:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            text.write(f'tracemalloc: current={current/1e6:.3f}MB, peak={peak/1e6:.3f}MB\n')
+            for stat in snapshot.statistics('lineno')[:self.top]:
+                text.write(f'{stat}\n')
+        with open(name + '.txt', 'w') as f:
+            f.write(text.getvalue())
@@ -0,0 +1,169 @@
+import json
+import math
+import os
+import time
+
+import numpy as np
+
+from .Parareal import make_solver
+from .Profiler import Instrumentation
+from .Simulation import Calc1d
+from .Storage import TrajectoryStore
+from .Sweep import process_pool
+
+class LevelCFG():
+    """
+    収束の調べで k 段目の計算に使う CFG
+    空間方向は格子点が入れ子になるように内部の点の数を (n-1)*ratio+1 に、Dx を 1/ratio 倍にする
+    時間方向は Dt を 1/ratio 倍にし、timespan と brank を ratio 倍にする(保存する時刻はどの段も同じ)
+    initialdata は元の格子の番号に換算した(整数でない)番号で元の CFG の initialdata を呼ぶ
+    """
+
+    def __init__(self, base, level: int, space: int, time: int, ghost: int, output_dir: str):
+        """
+        Parameter
+        ---------
+        base: 元の CFG のインスタンス
+        space, time: 空間方向と時間方向の1段あたりの細かくする倍率 (1 なら細かくしない)
+        ghost: 片側の仮想点の数 (CahnHilliardEq_NeumannBC_1d_* は 2)
+        """
+        self.base = base
+        self.level = level
+        self.scale = space**level
+        self.ghost = ghost
+        inner = base.settings['N'] - 2*ghost
+        self.settings = dict(
+            base.settings,
+            N=(inner-1)*self.scale + 1 + 2*ghost,
+            Dx=base.settings['Dx']/self.scale,
+            Dt=base.settings['Dt']/time**level,
+        )
+        self.params = getattr(base, 'params', None)
+        self.timeset = dict(
+            base.timeset,
+            timespan=base.timeset['timespan']*time**level,
+            brank=base.timeset['brank']*time**level,
+        )
+        self.output_dir = output_dir
+        self.output_policy = getattr(base, 'output_policy', {})
+
+    def initialdata(self, idx):
+        return self.base.initialdata(self.ghost + (idx - self.ghost)/self.scale)
+
+def restrict(U, ratio: int, ghost: int) -> np.ndarray:
+    """ 細かい格子の解 U の内部の点のうち粗い格子と重なる点 """
+    U = np.asarray(U)
+    return U[..., ghost:U.shape[-1]-ghost][..., ::ratio]
+
+def run_level(cfg, make_equation, solver) -> dict:
+    """ 1段分の計算 (ワーカープロセスで実行される) """
+    start = time.perf_counter()
+    calc = Calc1d(cfg)
+    calc.preparation()
+    inst = Instrumentation(save=True, verbose=False)
+    calc.calc(make_equation(cfg), solver=make_solver(solver), observers=[inst])
+    summary = inst.summary()
+    return {
+        'level': cfg.level,
+        'output_dir': cfg.output_dir,
+        'N': cfg.settings['N'],
+        'Dx': cfg.settings['Dx'],
+        'Dt': cfg.settings['Dt'],
+        'elapsed': time.perf_counter() - start,
+        'nit_mean': summary.get('nit_mean'),
+        'nfev': summary.get('nfev'),
+        'njev': summary.get('njev'),
+    }
+
+def observed_orders(values: list, ratio: int) -> list:
+    """
+    各段の量 Q0, Q1, ... (スカラーか、粗い格子に揃えた配列) の隣どうしの差 e_k = |Q_{k+1} - Q_k| と
+    観測された収束の次数 p_k = log(e_k / e_{k+1}) / log(ratio)
+    """
+    diffs = [float(np.max(np.abs(np.asarray(b) - np.asarray(a)))) for a, b in zip(values[:-1], values[1:])]
+    # 丸め誤差程度の差 (保存される質量など) からは次数を出さない
+    eps = 1e-12 * (1 + max(float(np.max(np.abs(value))) for value in values))
+    orders = []
+    for e0, e1 in zip(diffs[:-1], diffs[1:]):
+        orders.append(math.log(e0/e1)/math.log(ratio) if e0 > eps and e1 > eps else None)
+    return diffs, orders
+
+def refinement_study(
+    cfg_inst,
+    make_equation,
+    levels: int = 3,
+    refine: str = 'space',
+    ratio: int = 2,
+    ghost: int = 2,
+    solver: str = 'newton',
+    max_workers: int = None,
+    output_dir: str = None,
+) -> dict:
+    """
+    格子幅・時間刻み幅を 1/ratio ずつ細かくした levels 段の計算で収束の次数を調べる
+    各段は {output_dir}/level={k} に Calc1d と同じ形で保存し、結果は {output_dir}/refinement.json に書く
+
+    各段は互いに独立なので、すべて同時に process_pool で計算する
+    粗い段の解を補間して細かい段の非線形の求解の初期推定値にする方法は反復を減らさないので使わない
+    (NewtonSolver は前の2ステップからの外挿ですでに2回で収束する。optimize.root (hybr) は推定値が近すぎると
+    信頼領域が縮んで nfev がかえって増え、時間方向の level=2 や空間方向の level=4 では1.5倍以上になった)
+
+    make_equation(cfg) は Sweep と同じく cfg から方程式クラスの equation メソッドを作る関数
+    CFG の initialdata は整数でない番号でも呼べる(番号の滑らかな関数)こと
+
+    Parameter
+    ---------
+    refine: str
+        'space': Dx だけ, 'time': Dt だけ, 'both': Dx と Dt を同時に細かくする
+    ghost: int
+        片側の仮想点の数 (CahnHilliardEq_NeumannBC_1d_* は 2, 仮想点のない配列は 0)
+    Return
+    ------
+    各段の計算の記録と、最後の時刻での U, 質量, エネルギーの段ごとの差と観測された次数
+    (質量とエネルギーは方程式クラスの diagnostics から計算する)
+    """
+    if cfg_inst.timeset['inittime'] != 0:
+        raise ValueError('refinement_study starts every level from inittime=0')
+    space = ratio if refine in ('space', 'both') else 1
+    time_ratio = ratio if refine in ('time', 'both') else 1
+    output_dir = os.path.join(cfg_inst.output_dir, 'refinement') if output_dir is None else output_dir
+
+    cfgs = [LevelCFG(cfg_inst, k, space, time_ratio, ghost, os.path.join(output_dir, f'level={k}')) for k in range(levels)]
+
+    start = time.perf_counter()
+    with process_pool(max_workers) as executor:
+        futures = [executor.submit(run_level, cfg, make_equation, solver) for cfg in cfgs]
+        results = [future.result() for future in futures]
+    wall = time.perf_counter() - start
+
+    # 最後の時刻の解を一番粗い格子に揃えて比べる (Calc1d.calc は最後の時刻ステップを必ず保存する)
+    U, mass, energy = [], [], []
+    for k, cfg in enumerate(cfgs):
+        with TrajectoryStore(os.path.join(cfg.output_dir, 'var'), 'U') as store:
+            Uend = np.array(store.load(cfg.timeset['timespan']))
+        U.append(restrict(Uend, space**k, ghost))
+        eq_inst = make_equation(cfg).__self__
+        if hasattr(eq_inst, 'diagnostics'):
+            values = eq_inst.diagnostics(Uend)
+            mass.append(float(values['mass']))
+            energy.append(float(values['energy']))
+
+    report = {
+        'refine': refine,
+        'ratio': ratio,
+        'wall': wall,
+        'levels': results,
+    }
+    for name, values in (('U', U), ('mass', mass), ('energy', energy)):
+        if len(values) == levels:
+            diffs, orders = observed_orders(values, ratio)
+            report[name] = {'diffs': diffs, 'orders': orders}
+    with open(os.path.join(output_dir, 'refinement.json'), 'w') as f:
+        json.dump(report, f, indent=2)
+
+    for result in results:
+        print(f"level={result['level']}: N={result['N']}, Dt={result['Dt']}, {result['elapsed']:.2f}s, nit mean {result['nit_mean']}")
+    for name in ('U', 'mass', 'energy'):
+        if name in report:
+            print(f"{name}: diffs {report[name]['diffs']}, orders {report[name]['orders']}")
+    return report
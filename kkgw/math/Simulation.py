@@ -1,11 +1,65 @@
+import hashlib
 import json
 import os
 import pickle
+import random
+import time
+import warnings
 
 import numpy as np
-from scipy import optimize
+
+from .Solver import NewtonSolver, StepSizeController, banded_lu, lu_solve
+from .Storage import AsyncWriter, Checkpoint, TrajectoryStore
+
+def step_info(result, explicit: bool) -> dict:
+    """
+    1ステップの求解の統計 (Profiler.Observer.step に渡す info の一部)
+    result: optimize.root か NewtonSolver.solve の結果 (陽的・線形スキームでは None)
+    """
+    if result is None:
+        # 陽的スキームは残差の評価なし、線形スキームは後退代入1回
+        return {'success': True, 'nit': 0 if explicit else 1, 'nfev': 0, 'njev': 0, 'residual': None, 'message': ''}
+    fun = result.get('fun')
+    return {
+        'success': bool(result.success),
+        'nit': int(result.get('nit', result.get('nfev', 0))), # hybr は反復回数を返さないので評価回数で代用する
+        'nfev': int(result.get('nfev', 0)),
+        'njev': int(result.get('njev', 0)),
+        'residual': None if fun is None else float(np.abs(fun).max()),
+        'message': str(result.get('message', '')),
+    }
+
+def stable_hash(cfg_inst, equation, U0, **extra) -> str:
+    """
+    計算結果を決める設定のハッシュ
+    CFG の settings, 方程式クラス(モジュール名とクラス名)とその settings, params, 初期値と extra から作る
+    (timeset は含めないので、同じ計算の長さ違いは同じキーになる)
+    """
+    eq_inst = getattr(equation, '__self__', None)
+    owner = equation if eq_inst is None else type(eq_inst)
+    config = dict({
+        'settings': cfg_inst.settings,
+        'scheme': f'{owner.__module__}.{owner.__qualname__}',
+        'scheme_settings': getattr(eq_inst, 'settings', None),
+        'params': getattr(eq_inst, 'params', None),
+    }, **extra)
+    h = hashlib.sha256()
+    h.update(json.dumps(config, sort_keys=True, default=lambda x: np.asarray(x).tolist()).encode())
+    U0 = np.ascontiguousarray(U0, dtype=float)
+    h.update(str(U0.shape).encode())
+    h.update(U0.tobytes())
+    return h.hexdigest()[:32]
 
 class Calc1d():
+    """
+    フォルダ階層
+    {output_dir}---var---U.dat, U.idx, U.json       <- TrajectoryStore
+                 |     |-dUdt.dat, dUdt.idx, dUdt.json
+                 |-cfg.pkl
+                 |-cfg.json
+                 |-checkpoint---step=***.pkl         <- Storage.Checkpoint
+                 |-events.json                       <- Monitor の記録 (あれば)
+    """
 
     def __init__(
         self,
@@ -34,6 +88,8 @@ class Calc1d():
                 self.settings = settings
                 self.timeset = timeset
                 self.output_dir = output_dir
+                # (省略可) 変数ごとの保存の方針 (Storage.normalize_policy)
+                self.output_policy = {'dUdt': {'dtype': 'float32', 'compression': 'zlib'}}
             
             def initialdata(self, U):
                 return 更新されたU
@@ -43,10 +99,16 @@ class Calc1d():
         self.timeset = self.cfg.timeset
         self.output_dir = self.cfg.output_dir
         self.initialdata = self.cfg.initialdata # function
+        self.output_policy = getattr(self.cfg, 'output_policy', {}) # 変数ごとの保存の方針
 
         OUTPUT_VAR = os.path.join(self.output_dir, 'var')
         os.makedirs(OUTPUT_VAR, exist_ok=True)
         self.output_var = OUTPUT_VAR
+        self.stores = {} # 開いている TrajectoryStore
+        self.writer = None # 非同期書き込み
+        self.brank = self.timeset['brank'] # 今の保存間隔 (Monitor が計算中に切り替える)
+        self.stop_reason = None # 計算を途中で止める理由 (Monitor が設定する)
+        self.events = [] # Monitor が条件を満たした記録
 
         str_dt = str(self.settings['Dt'])
         if '.' in str_dt:
@@ -59,47 +121,608 @@ class Calc1d():
 
     def preparation(self):
         """ 準備 """
+        self.save_cfg()
+        # 前の計算のチェックポイントから再開しないように消す
+        Checkpoint(self.output_dir).clear()
+
+        # 初期値の保存
+        self.store('U').clear()
+        self.store('dUdt').clear()
+        self.store('U').append(0, 0.0, self.initialstate())
+        self.close_stores()
+
+    def initialstate(self) -> np.ndarray:
+        """ initialdata から作った初期値 """
         N = self.settings['N']
+        U = np.zeros(N)
+        for idx in range(0, N):
+            U[idx] = self.initialdata(idx)
+        return U
+
+    def identity(self, equation) -> str:
+        """ チェックポイントに書く計算のハッシュ (設定や初期値の違う計算から再開しないため) """
+        return stable_hash(self.cfg, equation, self.initialstate())
 
-        OUTPUT_U = os.path.join(self.output_var, 'U')
-        os.makedirs(OUTPUT_U, exist_ok=True)
+    def shape(self) -> tuple:
+        """ 1時刻の解の形 """
+        return (self.settings['N'],)
 
-        # 設定の保存
+    def save_cfg(self):
+        """ 設定の保存 """
         with open(os.path.join(self.output_dir, 'cfg.pkl'), 'wb') as f:
             pickle.dump(self.cfg, f)
         with open(os.path.join(self.output_dir, 'cfg.json'), 'w') as f:
-            json.dump(vars(self.cfg), f, indent=2)
+            # 入れ子の CFG (Refinement.LevelCFG の base など) は属性の辞書として書く
+            json.dump(vars(self.cfg), f, indent=2, default=lambda x: vars(x) if hasattr(x, '__dict__') else np.asarray(x).tolist())
+
+    def store(self, varname: str, output_var=None) -> TrajectoryStore:
+        """ 変数 varname の TrajectoryStore (開いたものを使い回す) """
+        output_var = self.output_var if output_var is None else output_var
+        key = (output_var, varname)
+        if key not in self.stores:
+            self.stores[key] = TrajectoryStore(output_var, varname, self.output_policy.get(varname))
+        return self.stores[key]
+
+    def close_stores(self):
+        for store in self.stores.values():
+            store.close()
+        self.stores = {}
+
+    def open_writer(self, async_io: int = 0):
+        """ async_io > 0 なら長さ async_io のキューで非同期に書き込む """
+        self.writer = AsyncWriter(async_io) if async_io > 0 else None
+
+    def close_writer(self, raise_error: bool = True):
+        """ 残りの書き込みを終わらせる """
+        if self.writer is not None:
+            writer, self.writer = self.writer, None
+            writer.close(raise_error)
+
+    def write(self, func, *args):
+        """ 書き込みを実行する(非同期書き込みならキューに入れる) """
+        if self.writer is None:
+            func(*args)
+        else:
+            self.writer.submit(func, *args)
+
+    def load(self, t: int, varname='U', output_var=None) -> np.ndarray:
+        """ 時刻ステップ t の保存済みの解 """
+        Dt = self.settings['Dt']
+        output_var = self.output_var if output_var is None else output_var
+
+        store = self.store(varname, output_var)
+        if len(store) > 0:
+            if not store.lossless:
+                warnings.warn(f'{varname} is stored with a lossy output policy; restarting from it is not exact (use a checkpoint)')
+            return np.array(store.load(t))
+        # 1ステップ1ファイルの旧形式
+        return np.load(os.path.join(output_var, varname, f't={round(t*Dt, self.dig)}.npy'))
+
+    def save(self, t: int, U2, U1, output_var=None, dt=None):
+        """
+        時刻ステップ t の解と時間差分の保存
+        dt: U1 から U2 までの時間刻み幅 (省略時は Dt)
+        """
+        Dt = self.settings['Dt']
+        dt = Dt if dt is None else dt
+
+        self.write(self.store('U', output_var).append, t, t*Dt, U2)
+        self.write(self.store('dUdt', output_var).append, t, t*Dt, (U2-U1)/dt)
+
+    def calc(self, equation, fuse=False, solver=None, async_io=0, checkpoint=0, resume=False, diagnostics=None, observers=None):
+        """
+        時間発展の計算
+        Parameter
+        ---------
+        equation:
+            方程式クラスの equation メソッド
+            クラスが step を持つ陽的スキームなら根の探索をせずに直接進める
+            クラスが linear = True なら係数行列を一度だけ LU 分解して、各ステップは後退代入だけで解く
+        fuse: bool
+            陽的スキームで、保存点の間のステップを step でまとめて進める
+        solver: NewtonSolver
+            指定すると optimize.root の代わりに使う(方程式クラスに jacobian が必要)
+        async_io: int
+            0 より大きければ、このキューの長さで保存を別スレッドで行う
+        checkpoint: int
+            0 より大きければ、このステップ数ごとと最後にチェックポイントを保存する
+        resume: bool
+            計算範囲内のチェックポイントがあれば、その時刻から再開する
+        diagnostics: Diagnostics
+            質量やエネルギーなどを計算中に記録する
+        observers: list
+            各ステップの時間やソルバーの統計を受け取る (Profiler.Instrumentation, Profiler.ProfileWindow など)
+            Monitor.DerivativeMonitor などは条件を満たすと計算を止めたり保存間隔を切り替えたりする
+        """
+        Dt = self.settings['Dt']
+        inittime = self.timeset['inittime']
+        timespan = self.timeset['timespan']
+        brank = self.timeset['brank']
+        endtime = inittime + timespan
+
+
+        eq_inst = getattr(equation, '__self__', None)
+        explicit = hasattr(eq_inst, 'step')
+        linear = getattr(eq_inst, 'linear', False)
+
+        # 方程式クラスがヤコビ行列を持っていれば差分近似の代わりに使う
+        jac = None
+        if hasattr(eq_inst, 'jacobian'):
+            jac = lambda U2, U1: eq_inst.jacobian(U2, U1).toarray()
+        if solver is not None:
+            solver.reset()
+        lu = None # 線形スキームの係数行列の LU 分解
+        identity = self.identity(equation) if checkpoint > 0 or resume else None
+
+        # 初期値の読み出し(再開する時刻より後の記録は計算し直すので消す)
+        U = np.zeros((2,) + self.shape()) # 2ステップ分のU
+        t = inittime
+        state = self.load_checkpoint(solver, identity) if resume else None
+        if state is None and inittime == 0 and not self.store('U').lossless:
+            # 保存の方針で丸めた初期値ではなく元の初期値から計算する
+            U[0] = self.initialstate()
+        elif state is None:
+            U[0] = self.load(inittime)
+        else:
+            t = state['step']
+            U[0] = state['U']
+        for varname in ('U', 'dUdt'):
+            self.store(varname).truncate(t)
+        saved = t # 最後にチェックポイントを保存した時刻ステップ
+
+        observers = [] if observers is None else observers
+        self.brank = brank
+        self.stop_reason = None
+        self.events = []
+        self.open_writer(async_io)
+        try:
+            if diagnostics is not None:
+                diagnostics.start(self, t, U[0])
+            for observer in observers:
+                observer.start(self, t, U[0])
+            while t < endtime:
+                tic = time.perf_counter()
+                nstep = 0
+                if explicit and fuse and (diagnostics is None or diagnostics.every == 0):
+                    # 次の保存点の1ステップ前までまとめて進める
+                    nstep = self.next_savetime(t, self.brank) - t - 1
+                    if nstep > 0:
+                        U[0] = eq_inst.step(U[0], nstep)
+                        t += nstep
+                t += 1
+
+                U1 = U[0]
+                result = None
+                if explicit:
+                    U[1] = eq_inst.step(U1)
+                elif linear:
+                    if lu is None:
+                        lu = banded_lu(eq_inst.system_matrix(U1))
+                    U[1] = lu_solve(lu, eq_inst.rhs(U1))
+                elif solver is not None:
+                    result = solver.solve(equation, eq_inst.jacobian, U1)
+                    U[1] = result.x
+                else:
+                    from scipy import optimize
+                    # result = optimize.root(equation, U1, method="broyden1")
+                    result = optimize.root(equation, U1, args=U1, method="hybr", jac=jac)
+                    U[1] = result.x
+                tsolve = time.perf_counter()
+
+                # 最後の時刻ステップは続きを計算できるように必ず保存する
+                is_save = t%self.brank==0 or t==(inittime+1) or t==endtime
+                if is_save:
+                    self.save(t, U[1], U[0])
+                    if t%(brank*100)==0 or t==(inittime+1):
+                        print(f't={round(t*Dt, self.dig)}')
+                if diagnostics is not None and diagnostics.due(t, is_save):
+                    diagnostics.record(self, t, U[1])
+                if checkpoint > 0 and (t-saved >= checkpoint or t == endtime):
+                    self.save_checkpoint(t, U[1], U[0], solver, identity)
+                    saved = t
+
+                if observers:
+                    info = step_info(result, explicit)
+                    info.update(t=t, nstep=max(nstep, 0)+1, wall=time.perf_counter()-tic, solve=tsolve-tic)
+                    info.update(io=info['wall']-info['solve'], saved=is_save, U=U[1], Uprev=U[0])
+                    for observer in observers:
+                        observer.step(self, info)
+
+                if self.stop_reason is not None:
+                    # 止めた時刻の解は保存点でなくても残す
+                    if not is_save:
+                        self.save(t, U[1], U[0])
+                    if diagnostics is not None and not diagnostics.due(t, is_save):
+                        diagnostics.record(self, t, U[1])
+                    if checkpoint > 0 and saved != t:
+                        self.save_checkpoint(t, U[1], U[0], solver, identity)
+                    print(f't={round(t*Dt, self.dig)}: stopped ({self.stop_reason})')
+                    break
+                U[0] = U[1]
+            self.close_writer()
+            if self.events:
+                self.save_events(t)
+            if diagnostics is not None:
+                diagnostics.finish(self)
+        finally:
+            self.close_writer(raise_error=False)
+            self.close_stores()
+            for observer in observers:
+                observer.finish(self)
+
+    def advance(self, equation, U1, h: float, solver=None):
+        """
+        時間刻み幅 h で1ステップ進める
+        方程式クラスの settings['Dt'] を一時的に h に書き換える
+        Return
+        ------
+        (U2, 収束したか)
+        """
+        eq_inst = equation.__self__
+        Dt = eq_inst.settings['Dt']
+        eq_inst.settings['Dt'] = h
+        try:
+            if hasattr(eq_inst, 'step'):
+                return eq_inst.step(U1), True
+            if getattr(eq_inst, 'linear', False):
+                return lu_solve(banded_lu(eq_inst.system_matrix(U1)), eq_inst.rhs(U1)), True
+            if solver is not None:
+                # 刻み幅が変わるとヤコビ行列も外挿も使えないので毎回リセットする
+                solver.reset()
+                result = solver.solve(equation, eq_inst.jacobian, U1)
+            else:
+                from scipy import optimize
+                jac = None
+                if hasattr(eq_inst, 'jacobian'):
+                    jac = lambda U2, U1: eq_inst.jacobian(U2, U1).toarray()
+                result = optimize.root(equation, U1, args=U1, method="hybr", jac=jac)
+            return result.x, bool(result.success)
+        finally:
+            eq_inst.settings['Dt'] = Dt
+
+    def calc_adaptive(self, equation, solver=None, controller=None, async_io=0, diagnostics=None):
+        """
+        時間刻み幅を自動で調整する時間発展の計算
+        保存する時刻ステップは calc と同じで、保存時刻 t*Dt にちょうど止まるように刻み幅を切り詰める
+        Parameter
+        ---------
+        equation:
+            方程式クラスの equation メソッド
+        solver: NewtonSolver
+            指定すると optimize.root の代わりに使う
+        controller: StepSizeController
+            省略時は StepSizeController()
+        async_io: int
+            0 より大きければ、このキューの長さで保存を別スレッドで行う
+        diagnostics: Diagnostics
+            質量やエネルギーなどを保存する時刻ステップごとに記録する
+        """
+        Dt = self.settings['Dt']
+        inittime = self.timeset['inittime']
+        timespan = self.timeset['timespan']
+        brank = self.timeset['brank']
+        endtime = inittime + timespan
+        controller = StepSizeController() if controller is None else controller
+
+        U1 = self.load(inittime)
+        for varname in ('U', 'dUdt'):
+            self.store(varname).truncate(inittime)
+
+        h = Dt if controller.dtmax is None else min(Dt, controller.dtmax) # 次に試す刻み幅
+        naccept = nreject = 0
+        t = inittime
+        current = inittime*Dt # 今の時刻 (t は最後に保存した時刻ステップ)
+
+        self.open_writer(async_io)
+        try:
+            if diagnostics is not None:
+                diagnostics.start(self, t, U1)
+            while t < endtime:
+                ts = self.next_savetime(t)
+                target = ts*Dt
+                # 足し算の丸め誤差で保存時刻の手前に残るわずかな時間は今のステップに含める
+                slack = max(controller.dtmin, 8*np.finfo(float).eps*abs(target))
+                while current < target:
+                    clipped = h >= target - current - slack
+                    hstep = target - current if clipped else h
+                    if hstep < controller.dtmin:
+                        raise RuntimeError(f'time step {hstep} became smaller than dtmin at time {current}')
+
+                    U_full, ok_full = self.advance(equation, U1, hstep, solver)
+                    U_mid, ok_mid = self.advance(equation, U1, hstep/2, solver)
+                    U_half, ok_half = self.advance(equation, U_mid, hstep/2, solver)
+                    if not (ok_full and ok_mid and ok_half):
+                        h = hstep/2 # 解けなかったので刻み幅を半分にしてやり直す
+                        nreject += 1
+                        continue
+
+                    err = controller.error(U_full, U_half)
+                    hnew = controller.propose(hstep, err)
+                    if err > controller.tol:
+                        h = hnew
+                        nreject += 1
+                        continue
+
+                    naccept += 1
+                    U0, U1, hlast = U_mid, U_half, hstep/2
+                    current = target if clipped else current + hstep
+                    if not clipped:
+                        h = hnew
+
+                t = ts
+                self.save(t, U1, U0, dt=hlast)
+                if diagnostics is not None:
+                    diagnostics.record(self, t, U1)
+                if t%(brank*100)==0 or t==(inittime+1):
+                    print(f't={round(t*Dt, self.dig)}, dt={h:.3g}, accepted={naccept}, rejected={nreject}')
+            self.close_writer()
+            if diagnostics is not None:
+                diagnostics.finish(self)
+        finally:
+            self.close_writer(raise_error=False)
+            self.close_stores()
+        print(f'accepted={naccept}, rejected={nreject}')
+
+    def save_checkpoint(self, t: int, U2, U1, solver=None, identity: str = None):
+        """
+        時刻ステップ t の全状態(解, 1つ前の解, ソルバーの状態, 乱数の状態)の保存
+        identity: 計算のハッシュ (Calc1d.identity)
+        """
+        # 時刻ステップ t までの解を書き終えてから保存する
+        if self.writer is not None:
+            self.writer.flush()
+        for store in self.stores.values():
+            store.flush()
+
+        Checkpoint(self.output_dir).save(t, {
+            'U': np.array(U2),
+            'Uprev': np.array(U1),
+            'solver': None if solver is None else solver.state_dict(),
+            'rng': {'numpy': np.random.get_state(), 'random': random.getstate()},
+            'identity': identity,
+        })
+
+    def load_checkpoint(self, solver=None, identity: str = None):
+        """
+        計算範囲内の最新のチェックポイントから状態を戻す(なければ None)
+        identity: 計算のハッシュ (Calc1d.identity)。チェックポイントのものと違えば ValueError
+        """
+        inittime = self.timeset['inittime']
+        endtime = inittime + self.timeset['timespan']
+
+        checkpoint = Checkpoint(self.output_dir)
+        step = checkpoint.latest()
+        if step is None or not (inittime < step <= endtime):
+            return None
+        state = checkpoint.load(step)
+        saved = state.get('identity')
+        if identity is not None and saved is not None and saved != identity:
+            raise ValueError(f'checkpoint at step {step} in {checkpoint.output_checkpoint} was written by a different configuration (run preparation() or remove it)')
+        if solver is not None and state['solver'] is not None:
+            solver.load_state_dict(state['solver'])
+        np.random.set_state(state['rng']['numpy'])
+        random.setstate(state['rng']['random'])
+        return state
+
+    def request_stop(self, reason: str):
+        """ 今の時刻ステップで計算を止める (Monitor から呼ぶ) """
+        self.stop_reason = reason
+
+    def save_events(self, t: int):
+        """ Monitor の記録と計算を終えた時刻ステップ t を {output_dir}/events.json に書く """
+        with open(os.path.join(self.output_dir, 'events.json'), 'w') as f:
+            json.dump({
+                'stopped': t if self.stop_reason is not None else None,
+                'reason': self.stop_reason,
+                'events': self.events,
+            }, f, indent=2, default=lambda x: np.asarray(x).tolist())
+
+    def next_savetime(self, t: int, brank: int = None) -> int:
+        """ 時刻ステップ t の次に解を保存するステップ(計算終了時刻で打ち切り) """
+        inittime = self.timeset['inittime']
+        endtime = inittime + self.timeset['timespan']
+        brank = self.timeset['brank'] if brank is None else brank
+
+        if t < inittime+1:
+            return inittime+1
+        return min((t//brank+1)*brank, endtime)
+
+class CalcEnsemble1d(Calc1d):
+    """
+    係数や初期値だけが異なる M 個の計算をまとめて進める
+    解は (M, N) の配列で持ち、方程式クラスの残差とヤコビ行列を全メンバーについて一度に計算する
+    ヤコビ行列はブロック対角の帯行列になるので、1回の帯行列 LU 分解で全メンバー分を解く
+
+    フォルダ階層
+    {output_dir}---member=0---var---U.dat, U.idx, U.json
+                 |          |     |-dUdt.dat, dUdt.idx, dUdt.json
+                 |-member=1
+                 ...
+    """
+
+    def __init__(
+        self,
+        cfg_inst, # cfgクラスのインスタンス
+        M: int, # メンバー数
+    ):
+        """
+        cfg.initialdata(idx) はスカラーか長さ M の配列を返す
+        メンバーごとに係数を変えるときは stack_params で作った params を方程式クラスに渡す
+        """
+        super().__init__(cfg_inst)
+        self.M = M
+        self.member_var = []
+        for m in range(M):
+            OUTPUT_VAR = os.path.join(self.output_dir, f'member={m}', 'var')
+            os.makedirs(OUTPUT_VAR, exist_ok=True)
+            self.member_var.append(OUTPUT_VAR)
+
+    @staticmethod
+    def stack_params(params_list: list) -> dict:
+        """ メンバーごとの params のリストを (M, 1) の配列の params にまとめる """
+        return {
+            key: np.array([params[key] for params in params_list], dtype=float)[:, None]
+            for key in params_list[0]
+        }
+
+    def preparation(self):
+        """ 準備 """
+        self.save_cfg()
+        Checkpoint(self.output_dir).clear()
 
         # 初期値の保存
-        U = np.zeros((N, 2)) # 2ステップ分のU
-        for idx in range(0, N):
-            U[idx, 0] = self.initialdata(idx)
-        np.save(os.path.join(OUTPUT_U, f't=0.0.npy'), U[:, 0])
+        U = self.initialstate()
+        for m in range(self.M):
+            self.store('U', self.member_var[m]).clear()
+            self.store('dUdt', self.member_var[m]).clear()
+            self.store('U', self.member_var[m]).append(0, 0.0, U[m])
+        self.close_stores()
 
-    def calc(self, equation):
+    def initialstate(self) -> np.ndarray:
+        """ initialdata から作った全メンバーの初期値 (M, N) """
+        U = np.zeros((self.M, self.settings['N']))
+        for idx in range(0, self.settings['N']):
+            U[:, idx] = self.initialdata(idx)
+        return U
 
+    def calc(self, equation, fuse=False, solver=None, async_io=0, checkpoint=0, resume=False):
+        """
+        時間発展の計算
+        Parameter
+        ---------
+        equation:
+            方程式クラスの equation メソッド
+        fuse: bool
+            陽的スキームで、保存点の間のステップを step でまとめて進める
+        solver: NewtonSolver
+            省略時は、方程式クラスに jacobian があれば NewtonSolver() を使う
+        async_io: int
+            0 より大きければ、このキューの長さで保存を別スレッドで行う
+        checkpoint: int
+            0 より大きければ、このステップ数ごとと最後にチェックポイントを保存する
+        resume: bool
+            計算範囲内のチェックポイントがあれば、その時刻から再開する
+        """
         N = self.settings['N']
         Dt = self.settings['Dt']
+        M = self.M
         inittime = self.timeset['inittime']
         timespan = self.timeset['timespan']
         brank = self.timeset['brank']
+        endtime = inittime + timespan
+
+        eq_inst = getattr(equation, '__self__', None)
+        explicit = hasattr(eq_inst, 'step')
+        linear = getattr(eq_inst, 'linear', False)
+        lu = None # 線形スキームの係数行列の LU 分解
+
+        # 全メンバーを1本のベクトルにまとめた方程式
+        shape = (M, N)
+        fun = lambda U2, U1: equation(U2.reshape(shape), U1.reshape(shape)).ravel()
+        if solver is None and hasattr(eq_inst, 'jacobian'):
+            solver = NewtonSolver()
+        if solver is not None:
+            jac = lambda U2, U1: eq_inst.jacobian(U2.reshape(shape), U1.reshape(shape))
+            solver.reset()
+        identity = self.identity(equation) if checkpoint > 0 or resume else None
 
         # 初期値の読み出し
-        U = np.zeros((N, 2))
-        U[:, 0] = np.load(os.path.join(self.output_var, 'U', f't={inittime*Dt}.npy'))
-
-        for t in range(inittime+1, inittime+timespan+1):
-            U1 = U[:,0]
-            # result = optimize.root(equation, U1, method="broyden1")
-            result = optimize.root(equation, U1, args=U1, method="hybr")
-            U[:,1] = result.x
-
-            if t%brank==0 or t==(inittime+1):
-                np.save(os.path.join(self.output_var, 'U', f't={round(t*Dt, self.dig)}.npy'), U[:,1])
-                OUTPUT_dUdt = os.path.join(self.output_var, 'dUdt')
-                os.makedirs(OUTPUT_dUdt, exist_ok=True)
-                np.save(os.path.join(OUTPUT_dUdt, f't={round(t*Dt, self.dig)}.npy'), (U[:,1]-U[:,0])/Dt)
-                if t%(brank*100)==0 or t==(inittime+1):
-                    print(f't={round(t*Dt, self.dig)}')
+        U = np.zeros((2, M, N)) # 2ステップ分のU (メンバーの軸を連続にするため時間を先頭に置く)
+        t = inittime
+        state = self.load_checkpoint(solver, identity) if resume else None
+        if state is not None:
+            t = state['step']
+            U[0] = state['U']
+        for m in range(M):
+            if state is None:
+                U[0, m] = self.load(inittime, output_var=self.member_var[m])
+            for varname in ('U', 'dUdt'):
+                self.store(varname, self.member_var[m]).truncate(t)
+        saved = t # 最後にチェックポイントを保存した時刻ステップ
+
+        self.open_writer(async_io)
+        try:
+            while t < endtime:
+                if explicit and fuse:
+                    # 次の保存点の1ステップ前までまとめて進める
+                    nstep = self.next_savetime(t) - t - 1
+                    if nstep > 0:
+                        U[0] = eq_inst.step(U[0], nstep)
+                        t += nstep
+                t += 1
+
+                U1 = U[0]
+                if explicit:
+                    U[1] = eq_inst.step(U1)
+                elif linear:
+                    if lu is None:
+                        lu = banded_lu(eq_inst.system_matrix(U1))
+                    U[1] = lu_solve(lu, eq_inst.rhs(U1).ravel()).reshape(shape)
+                elif solver is not None:
+                    result = solver.solve(fun, jac, U1.ravel())
+                    U[1] = result.x.reshape(shape)
+                else:
+                    from scipy import optimize
+                    result = optimize.root(fun, U1.ravel(), args=U1.ravel(), method="hybr")
+                    U[1] = result.x.reshape(shape)
+
+                if t%brank==0 or t==(inittime+1) or t==endtime:
+                    for m in range(M):
+                        self.save(t, U[1, m], U[0, m], output_var=self.member_var[m])
+                    if t%(brank*100)==0 or t==(inittime+1):
+                        print(f't={round(t*Dt, self.dig)}')
+                if checkpoint > 0 and (t-saved >= checkpoint or t == endtime):
+                    self.save_checkpoint(t, U[1], U[0], solver, identity)
+                    saved = t
+
+                U[0] = U[1]
+            self.close_writer()
+        finally:
+            self.close_writer(raise_error=False)
+            self.close_stores()
+
+class Calc2d(Calc1d):
+    """
+    2次元の計算 (解は U[i, j] = u(x_i, y_j) の (Nx, Ny) 配列)
+    calc, calc_adaptive, チェックポイント, Diagnostics は Calc1d と共通
+    方程式クラスは step を持つもの (CahnHilliardEq_NeumannBC_2d_Spectral など)
+
+    フォルダ階層は Calc1d と同じ (TrajectoryStore のヘッダーに解の形 (Nx, Ny) も保存する)
+    """
+
+    def __init__(
+        self,
+        cfg_inst, # cfgクラスのインスタンス
+    ):
+        """
+        CFG クラスの構成 (Calc1d との違いだけ)
+        ======
+        class CFG:
+            def __init__(
+                self,
+                settings = {
+                    'Nx': 128, # x 方向の分割数
+                    'Ny': 128, # y 方向の分割数
+                    'Dx': 0.5, # x 方向の分割幅
+                    'Dy': 0.5, # y 方向の分割幅
+                    'Dt': 0.5, # 時間の分割幅
+                },
+                ...
+            ):
+                ...
+
+            def initialdata(self, X, Y):
+                # X, Y は格子点の番号の (Nx, Ny) 配列 (indexing='ij')
+                return (Nx, Ny) の配列
+        """
+        super().__init__(cfg_inst)
+
+    def shape(self) -> tuple:
+        """ 1時刻の解の形 """
+        return (self.settings['Nx'], self.settings['Ny'])
 
-            U[:, 0] = U[:, 1]
\ No newline at end of file
+    def initialstate(self) -> np.ndarray:
+        """ initialdata から作った初期値 (initialdata は格子全体について一度に呼ぶ) """
+        Nx, Ny = self.shape()
+        X, Y = np.meshgrid(np.arange(Nx), np.arange(Ny), indexing='ij')
+        return np.array(np.broadcast_to(self.initialdata(X, Y), (Nx, Ny)), dtype=float)
@@ -0,0 +1,194 @@
+import numpy as np
+
+# scipy は使うときに読み込む(起動の速さのため)
+
+def banded_lu(J):
+    """
+    帯行列の LU 分解
+    Parameter
+    ---------
+    J: scipy.sparse の行列
+        方程式クラスの jacobian の戻り値
+    Return
+    ------
+    (lub, piv, kl, ku): lu_solve にそのまま渡す
+    """
+    from scipy.linalg import lapack
+
+    n = J.shape[0]
+    coo = J.tocoo()
+    kl = max(int((coo.row - coo.col).max(initial=0)), 0) # 下側の帯幅
+    ku = max(int((coo.col - coo.row).max(initial=0)), 0) # 上側の帯幅
+
+    # LAPACK の帯行列形式: ab[kl+ku+i-j, j] = J[i, j] (上の kl 行はピボット用の作業領域)
+    ab = np.zeros((2*kl+ku+1, n))
+    csr = J.tocsr()
+    for off in range(-kl, ku+1):
+        diag = csr.diagonal(off)
+        if off >= 0:
+            ab[kl+ku-off, off:] = diag
+        else:
+            ab[kl+ku-off, :n+off] = diag
+
+    lub, piv, info = lapack.dgbtrf(ab, kl, ku)
+    if info > 0:
+        raise np.linalg.LinAlgError('singular jacobian')
+    return lub, piv, kl, ku
+
+def lu_solve(lu, b, overwrite_b: bool = False) -> np.ndarray:
+    """
+    banded_lu の分解を使って J x = b を解く
+    overwrite_b=True なら(b が連続な float64 の配列のとき) b に解を上書きして新しい配列を作らない
+    """
+    from scipy.linalg import lapack
+
+    lub, piv, kl, ku = lu
+    x, info = lapack.dgbtrs(lub, kl, ku, b, piv, overwrite_b=overwrite_b)
+    if info != 0:
+        raise np.linalg.LinAlgError(f'dgbtrs failed (info={info})')
+    return x
+
+def maxabs(a) -> float:
+    """ 最大値ノルム (np.abs の一時配列を作らない) """
+    return max(a.max(), -a.min())
+
+class NewtonSolver():
+    """
+    帯行列のヤコビ行列を使うニュートン法
+    scipy.optimize.root の代わりに Calc1d.calc(solver=...) で使う
+
+    chord=True では LU 分解を反復と時間ステップをまたいで使い回し、
+    収束が遅くなったとき(縮小率が rate を超えたとき)だけ分解し直す
+    初期推定値は前の2ステップからの線形外挿 2*U1 - U0
+    反復の中では右辺と更新量の配列を使い回す
+    """
+
+    def __init__(
+        self,
+        xtol: float = 1e-10, # 更新量の相対許容誤差
+        ftol: float = 0.0, # 残差の許容誤差 (0 なら更新量だけで判定する)
+        maxiter: int = 50, # 最大反復回数
+        chord: bool = False, # 簡易ニュートン法
+        rate: float = 0.5, # 簡易ニュートン法で分解し直す縮小率
+        extrapolate: bool = True, # 前の2ステップから外挿した初期推定値
+    ):
+        self.xtol = xtol
+        self.ftol = ftol
+        self.maxiter = maxiter
+        self.chord = chord
+        self.rate = rate
+        self.extrapolate = extrapolate
+        self.reset()
+
+    def reset(self):
+        """ 時間ステップをまたいで持ち越す状態を消す """
+        self.lu = None # 使い回す LU 分解
+        self.Uprev = None # 1つ前のステップの解
+
+    def state_dict(self) -> dict:
+        """ チェックポイントに保存する状態(LU 分解は再開後に作り直す) """
+        return {'Uprev': self.Uprev}
+
+    def load_state_dict(self, state: dict):
+        self.reset()
+        self.Uprev = state['Uprev']
+
+    def predict(self, U1) -> np.ndarray:
+        """ 初期推定値 """
+        if self.extrapolate and self.Uprev is not None and self.Uprev.shape == U1.shape:
+            return 2*U1 - self.Uprev
+        return np.array(U1, dtype=float)
+
+    def solve(self, fun, jac, U1) -> 'scipy.optimize.OptimizeResult':
+        """
+        fun(U2, U1) = 0 を U2 について解く
+        Parameter
+        ---------
+        fun: 方程式クラスの equation
+        jac: 方程式クラスの jacobian
+        U1: 前の時刻の解
+        """
+        x = self.predict(U1)
+        dx = np.empty_like(x) # 更新量 (右辺 -F に解を上書きする)
+        nfev = njev = 0
+        success = False
+        step_prev = None
+        refactor = self.lu is None or not self.chord
+
+        for nit in range(1, self.maxiter+1):
+            F = np.asarray(fun(x, U1), dtype=float)
+            nfev += 1
+            if maxabs(F) <= self.ftol:
+                success = True
+                break
+
+            if refactor:
+                self.lu = banded_lu(jac(x, U1))
+                njev += 1
+                refactor = not self.chord
+                step_prev = None
+            np.negative(F, out=dx)
+            dx = lu_solve(self.lu, dx, overwrite_b=True)
+            x += dx
+
+            step = maxabs(dx)
+            if step <= self.xtol * (1 + maxabs(x)):
+                F = np.asarray(fun(x, U1), dtype=float)
+                nfev += 1
+                success = True
+                break
+            if self.chord and step_prev is not None and step > self.rate*step_prev:
+                refactor = True # 収束が遅いので次の反復で分解し直す
+            step_prev = step
+
+        if success:
+            self.Uprev = np.array(U1, dtype=float)
+        else:
+            self.lu = None
+            # F は最後の更新の前の残差なので、返す x での残差を計算し直す
+            F = np.asarray(fun(x, U1), dtype=float)
+            nfev += 1
+        from scipy.optimize import OptimizeResult
+        return OptimizeResult(
+            x=x, success=success, fun=np.array(F), nit=nit, nfev=nfev, njev=njev,
+            message='converged' if success else 'maximum number of iterations reached',
+        )
+
+class StepSizeController():
+    """
+    2倍刻み法(step doubling)による時間刻み幅の制御
+    刻み幅 h の1ステップと h/2 の2ステップの差から局所誤差を見積もる
+    """
+
+    def __init__(
+        self,
+        tol: float = 1e-6, # 1ステップあたりの局所誤差の許容値(最大値ノルム)
+        order: int = 2, # スキームの時間精度 (DVDM は2次)
+        safety: float = 0.9, # 刻み幅を決めるときの安全係数
+        fmin: float = 0.2, # 1回で刻み幅を縮める倍率の下限
+        fmax: float = 5.0, # 1回で刻み幅を広げる倍率の上限
+        dtmin: float = 1e-12, # これより小さくなったら計算を止める
+        dtmax: float = None, # 刻み幅の上限
+    ):
+        self.tol = tol
+        self.order = order
+        self.safety = safety
+        self.fmin = fmin
+        self.fmax = fmax
+        self.dtmin = dtmin
+        self.dtmax = dtmax
+
+    def error(self, U_full, U_half) -> float:
+        """ 局所誤差の見積もり (リチャードソン外挿) """
+        return np.abs(U_half - U_full).max() / (2**self.order - 1)
+
+    def propose(self, h: float, err: float) -> float:
+        """ 次に試す刻み幅 """
+        if err == 0:
+            factor = self.fmax
+        else:
+            factor = self.safety * (self.tol/err)**(1/(self.order+1))
+        h = h * min(self.fmax, max(self.fmin, factor))
+        if self.dtmax is not None:
+            h = min(h, self.dtmax)
+        return h
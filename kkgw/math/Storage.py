@@ -0,0 +1,459 @@
+import glob
+import json
+import os
+import pickle
+import queue
+import shutil
+import threading
+import zlib
+
+import numpy as np
+
+# 索引ファイルの1記録: 時刻ステップ(整数)と時刻
+INDEX_DTYPE = np.dtype([('step', '<i8'), ('time', '<f8')])
+# 圧縮したときの1記録の位置: .dat の中の先頭とバイト数
+OFFSET_DTYPE = np.dtype([('offset', '<i8'), ('nbytes', '<i8')])
+
+def normalize_policy(policy: dict) -> dict:
+    """
+    保存の方針 (TrajectoryStore の policy) の既定値を埋める
+    ======
+    'dtype': 保存する型 ('float32', 'float16' など、省略時は書き込んだ配列の型)
+    'stride': 空間方向の間引き (各軸 stride 点ごとに1点)
+    'every': 時刻ステップが every の倍数の記録だけ残す
+    'compression': None か 'zlib' (可逆圧縮)
+    'level': zlib の圧縮レベル
+    'tolerance': 誤差の上限 (正なら値を 2*tolerance 刻みに丸めた整数で保存する。zlib で圧縮する)
+    """
+    policy = dict({
+        'dtype': None,
+        'stride': 1,
+        'every': 1,
+        'compression': None,
+        'level': 6,
+        'tolerance': 0.0,
+    }, **(policy or {}))
+    if policy['tolerance'] > 0:
+        policy['compression'] = 'zlib'
+    if policy['compression'] not in (None, 'zlib'):
+        raise ValueError(f"unknown compression: {policy['compression']}")
+    return policy
+
+class CompressedRecords():
+    """
+    圧縮した記録の並び (TrajectoryStore.data)
+    memmap と同じく添字で取り出したときに初めて読み込んで展開する
+    スライスは展開せずに範囲だけを持つ
+    """
+
+    def __init__(self, store, offsets, lo: int, hi: int):
+        self.store = store
+        self.offsets = offsets
+        self.lo = lo
+        self.hi = hi
+
+    @property
+    def shape(self) -> tuple:
+        return (self.hi - self.lo,) + self.store.shape
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self.store.dtype
+
+    @property
+    def ndim(self) -> int:
+        return 1 + len(self.store.shape)
+
+    def __len__(self) -> int:
+        return self.hi - self.lo
+
+    def record(self, pos: int) -> np.ndarray:
+        """ pos 番目 (この並びの中での番号) の記録を展開する """
+        offset, nbytes = self.offsets[self.lo + pos]
+        with open(self.store.path_dat, 'rb') as f:
+            f.seek(int(offset))
+            return self.store.decode(f.read(int(nbytes)))
+
+    def __getitem__(self, key):
+        rows, rest = (key[0], key[1:]) if isinstance(key, tuple) else (key, ())
+        if isinstance(rows, (int, np.integer)):
+            pos = int(rows) + (len(self) if rows < 0 else 0)
+            if not 0 <= pos < len(self):
+                raise IndexError(pos)
+            output = self.record(pos)
+            return output[rest] if rest else output
+        if isinstance(rows, slice) and rows.step in (None, 1) and not rest:
+            lo, hi, _ = rows.indices(len(self))
+            return CompressedRecords(self.store, self.offsets, self.lo + lo, self.lo + max(lo, hi))
+        positions = np.arange(len(self))[rows]
+        output = np.array([self.record(pos) for pos in positions]).reshape((len(positions),) + self.store.shape)
+        return output[(slice(None),) + rest] if rest else output
+
+    def __iter__(self):
+        for pos in range(len(self)):
+            yield self.record(pos)
+
+    def __array__(self, dtype=None, copy=None):
+        output = self[np.arange(len(self))]
+        return output if dtype is None else output.astype(dtype)
+
+class TrajectoryStore():
+    """
+    1変数の時系列を1つのファイルに追記して保存する
+    フォルダ階層
+    {output_var}---{varname}.dat  : 各時刻の解 (記録数, n) を順に並べたバイナリ
+                 |-{varname}.idx  : 時刻ステップと時刻
+                 |-{varname}.off  : 圧縮したときの各記録の位置
+                 |-{varname}.json : ヘッダー (n, dtype, shape, policy)
+    読み出しは np.memmap なので時間窓の切り出しでコピーは起きない
+    (圧縮したときは CompressedRecords が取り出した記録だけを展開する)
+
+    policy (normalize_policy) で型の縮小、空間・時間方向の間引き、圧縮を指定できる
+    方針はヘッダーに書くので、読み出し側 (Plot2d, Anim2d など) は指定なしでそのまま読める
+    """
+
+    def __init__(self, output_var: str, varname: str, policy: dict = None):
+        """
+        policy: 新しく書き始めるときの保存の方針 (既存の記録があればヘッダーの方針を使う)
+        """
+        self.output_var = output_var
+        self.varname = varname
+        self.path_dat = os.path.join(output_var, f'{varname}.dat')
+        self.path_idx = os.path.join(output_var, f'{varname}.idx')
+        self.path_off = os.path.join(output_var, f'{varname}.off')
+        self.path_json = os.path.join(output_var, f'{varname}.json')
+
+        self.header = None
+        if os.path.exists(self.path_json):
+            with open(self.path_json) as f:
+                self.header = json.load(f)
+        self.new_policy = policy
+        self._fdat = None # 追記用のファイル
+        self._fidx = None
+        self._foff = None
+        self._mmap = None # 読み出し用の memmap (記録数が変わったら作り直す)
+
+    @staticmethod
+    def exists(output_var: str, varname: str) -> bool:
+        return os.path.exists(os.path.join(output_var, f'{varname}.json'))
+
+    @property
+    def dtype(self) -> np.dtype:
+        return np.dtype(self.header['dtype'])
+
+    @property
+    def n(self) -> int:
+        return self.header['n']
+
+    @property
+    def shape(self) -> tuple:
+        """ 1時刻の解の形 (shape のない旧いヘッダーは (n,)) """
+        return tuple(self.header.get('shape', [self.n]))
+
+    @property
+    def policy(self) -> dict:
+        """ 保存の方針 (policy のない旧いヘッダーは既定値) """
+        if self.header is not None:
+            return normalize_policy(self.header.get('policy'))
+        return normalize_policy(self.new_policy)
+
+    @property
+    def compressed(self) -> bool:
+        return self.policy['compression'] is not None
+
+    @property
+    def lossless(self) -> bool:
+        """ 書き込んだ解をそのまま読み出せるか (型の縮小・間引き・丸めなし) """
+        policy = self.policy
+        if policy['tolerance'] > 0 or policy['stride'] > 1 or policy['every'] > 1:
+            return False
+        return self.header is None or self.header.get('source_dtype', self.header['dtype']) == self.header['dtype']
+
+    def positions(self, axis: int = 0) -> np.ndarray:
+        """ 保存した点の元の格子点の番号 (stride で間引いたとき) """
+        full_shape = self.header.get('full_shape', self.shape)
+        return np.arange(0, full_shape[axis], self.policy['stride'])
+
+    def clear(self):
+        """ 保存済みの記録をすべて消す """
+        self.close()
+        for path in (self.path_dat, self.path_idx, self.path_off, self.path_json):
+            if os.path.exists(path):
+                os.remove(path)
+        self.header = None
+
+    def encode(self, U) -> bytes:
+        """ 1時刻の解を .dat に書くバイト列にする """
+        policy = self.policy
+        if policy['tolerance'] > 0:
+            # 2*tolerance 刻みに丸めた整数 (誤差は tolerance 以下)
+            codes = np.round(np.asarray(U, dtype=float) / (2*policy['tolerance']))
+            if np.abs(codes).max(initial=0) >= 2**31:
+                raise ValueError(f'{self.varname}: tolerance {policy["tolerance"]} is too small for the values')
+            U = codes.astype('<i4')
+        data = np.ascontiguousarray(U)
+        if policy['compression'] == 'zlib':
+            # バイトごとに並べ替えると浮動小数点数がよく縮む
+            shuffled = data.view(np.uint8).reshape(-1, data.itemsize).T
+            return zlib.compress(np.ascontiguousarray(shuffled).tobytes(), policy['level'])
+        return data.tobytes()
+
+    def decode(self, raw: bytes) -> np.ndarray:
+        """ encode の逆 """
+        policy = self.policy
+        dtype = np.dtype('<i4') if policy['tolerance'] > 0 else self.dtype
+        data = np.frombuffer(zlib.decompress(raw), dtype=np.uint8)
+        data = np.ascontiguousarray(data.reshape(dtype.itemsize, -1).T).view(dtype).reshape(self.shape)
+        if policy['tolerance'] > 0:
+            return (data * (2*policy['tolerance'])).astype(self.dtype)
+        return data
+
+    def append(self, step: int, time: float, U):
+        """ 時刻ステップ step の解を末尾に追加する (方針で間引く記録は書かない) """
+        U = np.asarray(U)
+        if self.header is None:
+            os.makedirs(self.output_var, exist_ok=True)
+            policy = normalize_policy(self.new_policy)
+            stored = U[(slice(None, None, policy['stride']),) * U.ndim]
+            dtype = np.dtype(policy['dtype']) if policy['dtype'] is not None else U.dtype
+            self.header = {'n': int(stored.size), 'dtype': dtype.str, 'shape': list(stored.shape)}
+            if self.new_policy:
+                self.header.update(policy=policy, full_shape=list(U.shape), source_dtype=U.dtype.str)
+            with open(self.path_json, 'w') as f:
+                json.dump(self.header, f, indent=2)
+        policy = self.policy
+        if step % policy['every'] != 0:
+            return
+        if policy['stride'] > 1:
+            U = U[(slice(None, None, policy['stride']),) * U.ndim]
+        U = np.ascontiguousarray(U, dtype=self.dtype)
+        if U.size != self.n:
+            raise ValueError(f'{self.varname}: size {U.size} does not match stored size {self.n}')
+
+        if self._fdat is None:
+            self._fdat = open(self.path_dat, 'ab')
+            self._fidx = open(self.path_idx, 'ab')
+            if self.compressed:
+                self._foff = open(self.path_off, 'ab')
+        # 解を書いてから索引を書く(索引があれば記録は完全)
+        raw = self.encode(U)
+        if self._foff is not None:
+            offset = self._fdat.seek(0, os.SEEK_END)
+            self._fdat.write(raw)
+            self._foff.write(np.array((offset, len(raw)), dtype=OFFSET_DTYPE).tobytes())
+        else:
+            self._fdat.write(raw)
+        self._fidx.write(np.array((step, time), dtype=INDEX_DTYPE).tobytes())
+
+    def flush(self):
+        if self._fdat is not None:
+            self._fdat.flush()
+            self._fidx.flush()
+            if self._foff is not None:
+                self._foff.flush()
+
+    def close(self):
+        if self._fdat is not None:
+            self._fdat.close()
+            self._fidx.close()
+            if self._foff is not None:
+                self._foff.close()
+        self._fdat = self._fidx = self._foff = None
+        self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self) -> int:
+        """ 記録数 """
+        if self.header is None:
+            return 0
+        self.flush()
+        nidx = os.path.getsize(self.path_idx) // INDEX_DTYPE.itemsize if os.path.exists(self.path_idx) else 0
+        if self.compressed:
+            noff = os.path.getsize(self.path_off) // OFFSET_DTYPE.itemsize if os.path.exists(self.path_off) else 0
+            return min(nidx, noff)
+        ndat = os.path.getsize(self.path_dat) // (self.n * self.dtype.itemsize) if os.path.exists(self.path_dat) else 0
+        return min(nidx, ndat)
+
+    def _memmap(self):
+        count = len(self)
+        if self._mmap is None or len(self._mmap[0]) != count:
+            if count == 0:
+                dtype = self.dtype if self.header is not None else float
+                shape = self.shape if self.header is not None else (0,)
+                self._mmap = (np.zeros(0, INDEX_DTYPE), np.zeros((0,) + shape, dtype))
+            else:
+                index = np.memmap(self.path_idx, dtype=INDEX_DTYPE, mode='r', shape=(count,))
+                if self.compressed:
+                    offsets = np.memmap(self.path_off, dtype=OFFSET_DTYPE, mode='r', shape=(count,))
+                    data = CompressedRecords(self, offsets, 0, count)
+                else:
+                    data = np.memmap(self.path_dat, dtype=self.dtype, mode='r', shape=(count,) + self.shape)
+                self._mmap = (index, data)
+        return self._mmap
+
+    @property
+    def steps(self) -> np.ndarray:
+        return self._memmap()[0]['step']
+
+    @property
+    def times(self) -> np.ndarray:
+        return self._memmap()[0]['time']
+
+    @property
+    def data(self) -> np.ndarray:
+        """ (記録数, *shape) の memmap (圧縮したときは CompressedRecords) """
+        return self._memmap()[1]
+
+    def position(self, step: int) -> int:
+        """ 時刻ステップ step の記録の位置 """
+        steps = self.steps
+        pos = int(np.searchsorted(steps, step))
+        if pos >= len(steps) or steps[pos] != step:
+            raise KeyError(f'{self.varname}: step {step} is not stored')
+        return pos
+
+    def load(self, step: int) -> np.ndarray:
+        """ 時刻ステップ step の解(memmap の行) """
+        return self.data[self.position(step)]
+
+    def window(self, start: int = None, stop: int = None):
+        """
+        時刻ステップが start 以上 stop 以下の記録
+        Return
+        ------
+        (steps, times, data): いずれも memmap のスライス (圧縮したときの data は CompressedRecords)
+        """
+        index, data = self._memmap()
+        steps = index['step']
+        lo = 0 if start is None else int(np.searchsorted(steps, start, side='left'))
+        hi = len(steps) if stop is None else int(np.searchsorted(steps, stop, side='right'))
+        return steps[lo:hi], index['time'][lo:hi], data[lo:hi]
+
+    def truncate(self, step: int):
+        """ 時刻ステップが step より後の記録を消す(途中から計算し直すとき) """
+        if self.header is None:
+            return
+        count = int(np.searchsorted(self.steps, step, side='right'))
+        sizes = {self.path_idx: count * INDEX_DTYPE.itemsize}
+        if self.compressed:
+            # 残す最後の記録の位置は .off から直接読む (記録がまだないときは memmap がない)
+            end = 0
+            if count > 0:
+                last = np.fromfile(self.path_off, dtype=OFFSET_DTYPE, count=1, offset=(count-1)*OFFSET_DTYPE.itemsize)[0]
+                end = int(last['offset'] + last['nbytes'])
+            sizes.update({self.path_off: count * OFFSET_DTYPE.itemsize, self.path_dat: end})
+        else:
+            sizes[self.path_dat] = count * self.n * self.dtype.itemsize
+        self.close()
+        # every で間引いてヘッダーしか書いていないときはファイルがない
+        for path, size in sizes.items():
+            if os.path.exists(path):
+                os.truncate(path, size)
+
+class AsyncWriter():
+    """
+    書き込みを別スレッドで行う
+    配列の引数は submit のときにコピーするので、呼び出し側はすぐに書き換えてよい
+    キューが一杯になると submit が待つ(ディスクが追いつかないときの背圧)
+    """
+
+    def __init__(self, maxsize: int = 16):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.error = None # 書き込みスレッドで起きた最初の例外
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                if self.error is None:
+                    func, args = item
+                    func(*args)
+            except Exception as e:
+                self.error = e
+            finally:
+                self.queue.task_done()
+
+    def submit(self, func, *args):
+        """ func(*args) を書き込みスレッドで実行する """
+        self._raise()
+        args = tuple(np.array(a) if isinstance(a, np.ndarray) else a for a in args)
+        self.queue.put((func, args))
+
+    def flush(self):
+        """ キューが空になるまで待つ """
+        self.queue.join()
+        self._raise()
+
+    def close(self, raise_error: bool = True):
+        """ 残りを書き込んでスレッドを止める """
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        if raise_error:
+            self._raise()
+
+    def _raise(self):
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(raise_error=exc_type is None)
+
+class Checkpoint():
+    """
+    計算を再開するための全状態の保存
+    フォルダ階層
+    {output_dir}---checkpoint---step=000000001000.pkl
+    一時ファイルに書いてから os.replace で置き換えるので、途中で止まっても壊れたファイルは残らない
+    """
+
+    def __init__(self, output_dir: str, keep: int = 2):
+        self.output_checkpoint = os.path.join(output_dir, 'checkpoint')
+        self.keep = keep # 残すチェックポイントの数
+
+    def path(self, step: int) -> str:
+        return os.path.join(self.output_checkpoint, f'step={step:012d}.pkl')
+
+    def steps(self) -> list:
+        """ 保存済みの時刻ステップ(昇順) """
+        paths = glob.glob(os.path.join(self.output_checkpoint, 'step=*.pkl'))
+        return sorted(int(os.path.basename(path)[5:-4]) for path in paths)
+
+    def latest(self):
+        """ 最新の時刻ステップ(なければ None) """
+        steps = self.steps()
+        return steps[-1] if steps else None
+
+    def save(self, step: int, state: dict):
+        os.makedirs(self.output_checkpoint, exist_ok=True)
+        tmp = self.path(step) + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(dict(state, step=step), f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path(step))
+
+        for old in self.steps()[:-self.keep]:
+            os.remove(self.path(old))
+
+    def clear(self):
+        """ 保存済みのチェックポイントをすべて消す """
+        shutil.rmtree(self.output_checkpoint, ignore_errors=True)
+
+    def load(self, step: int = None) -> dict:
+        """ 時刻ステップ step (省略時は最新) の状態 """
+        step = self.latest() if step is None else step
+        with open(self.path(step), 'rb') as f:
+            return pickle.load(f)
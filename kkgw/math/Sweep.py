@@ -0,0 +1,228 @@
+import argparse
+import contextlib
+import copy
+import importlib.util
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from ..utils import seed_setting
+from .Simulation import Calc1d
+from .Solver import NewtonSolver
+
+# 各プロセスの BLAS のスレッド数を 1 に固定する環境変数
+BLAS_ENV = (
+    'OMP_NUM_THREADS',
+    'OPENBLAS_NUM_THREADS',
+    'MKL_NUM_THREADS',
+    'VECLIB_MAXIMUM_THREADS',
+    'NUMEXPR_NUM_THREADS',
+)
+
+def param_grid(grid: dict) -> list:
+    """
+    パラメータの格子を全組み合わせのリストに展開する
+    Parameter
+    ---------
+    grid: dict
+        {'params': {'Gamma': [1, 2]}, 'settings': {'Dt': [0.1, 0.05]}} の形
+    Return
+    ------
+    [{'params': {'Gamma': 1}, 'settings': {'Dt': 0.1}}, ...]
+    """
+    keys = [(attr, key) for attr in grid for key in grid[attr]]
+    output = []
+    for values in itertools.product(*(grid[attr][key] for attr, key in keys)):
+        override = {attr: {} for attr in grid}
+        for (attr, key), value in zip(keys, values):
+            override[attr][key] = value
+        output.append(override)
+    return output
+
+def load_config(path: str):
+    """ CFG, make_equation, GRID を定義した設定ファイルを読み込む """
+    name = os.path.splitext(os.path.basename(path))[0]
+    if name in sys.modules and getattr(sys.modules[name], '__file__', None) == os.path.abspath(path):
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module # cfg.pkl に CFG を保存できるように登録する
+    spec.loader.exec_module(module)
+    return module
+
+@contextlib.contextmanager
+def single_thread_blas():
+    """ この中で起動した子プロセスの BLAS を1スレッドにする """
+    saved = {key: os.environ.get(key) for key in BLAS_ENV}
+    os.environ.update({key: '1' for key in BLAS_ENV})
+    try:
+        yield
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+def _init_worker():
+    """ 起動済みの BLAS にもスレッド数の制限をかける(threadpoolctl があれば) """
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        return
+    threadpool_limits(1)
+
+@contextlib.contextmanager
+def process_pool(max_workers: int = None):
+    """
+    子プロセスの BLAS を1スレッドにした spawn の ProcessPoolExecutor (Sweep, Parareal, Refinement で共通)
+    with process_pool(8) as executor:
+        results = list(executor.map(run, tasks))
+    """
+    # spawn で起動するので子プロセスは固定したスレッド数で BLAS を読み込む
+    with single_thread_blas():
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+        ) as executor:
+            yield executor
+
+def run(task: dict) -> dict:
+    """
+    1つの計算(ワーカープロセスで実行される)
+    Parameter
+    ---------
+    task: dict
+        cfg または config(設定ファイルのパス), make_equation, override, output_dir, seed, solver, fuse
+    """
+    if task.get('config') is not None:
+        module = load_config(task['config'])
+        cfg, make_equation = module.CFG(), module.make_equation
+    else:
+        cfg, make_equation = copy.deepcopy(task['cfg']), task['make_equation']
+    for attr, values in task['override'].items():
+        setattr(cfg, attr, dict(getattr(cfg, attr, {}), **values))
+    cfg.output_dir = task['output_dir']
+
+    seed_setting(task['seed'])
+    start = time.perf_counter()
+    calc = Calc1d(cfg)
+    calc.preparation()
+    solver = None
+    if task['solver'] is not None:
+        solver = NewtonSolver(chord=(task['solver'] == 'chord'))
+    calc.calc(make_equation(cfg), fuse=task['fuse'], solver=solver)
+
+    return {
+        'index': task['index'],
+        'output_dir': task['output_dir'],
+        'override': task['override'],
+        'seed': task['seed'],
+        'elapsed': time.perf_counter() - start,
+    }
+
+def sweep(
+    grid: dict,
+    cfg_inst=None,
+    make_equation=None,
+    config: str = None,
+    output_dir: str = None,
+    max_workers: int = None,
+    seed: int = 0,
+    solver: str = None,
+    fuse: bool = False,
+) -> list:
+    """
+    パラメータの格子を ProcessPoolExecutor で並列に計算する
+    i 番目の計算は {output_dir}/run={i:04d} に保存し、シードは seed + i
+
+    make_equation(cfg) は cfg から方程式クラスの equation メソッドを作る関数
+    (プロセス間で受け渡すのでモジュールの最上位で定義する)
+    ======
+    def make_equation(cfg):
+        settings = dict(cfg.settings, N=cfg.settings['N']-4)
+        return CahnHilliardEq_NeumannBC_1d_DVDM(settings, cfg.params).equation
+
+    Parameter
+    ---------
+    grid: dict
+        param_grid に渡す格子
+    cfg_inst, make_equation:
+        基準の CFG インスタンスと方程式の作成関数
+    config: str
+        cfg_inst, make_equation の代わりに CFG, make_equation を定義した設定ファイルのパス
+    output_dir: str
+        省略時は基準の CFG の output_dir
+    solver: str
+        None: optimize.root, 'newton': NewtonSolver(), 'chord': NewtonSolver(chord=True)
+    """
+    if config is not None:
+        base_dir = load_config(config).CFG().output_dir
+    else:
+        base_dir = cfg_inst.output_dir
+    output_dir = base_dir if output_dir is None else output_dir
+
+    tasks = []
+    for index, override in enumerate(param_grid(grid)):
+        tasks.append({
+            'index': index,
+            'cfg': cfg_inst,
+            'make_equation': make_equation,
+            'config': None if config is None else os.path.abspath(config),
+            'override': override,
+            'output_dir': os.path.join(output_dir, f'run={index:04d}'),
+            'seed': seed + index,
+            'solver': solver,
+            'fuse': fuse,
+        })
+
+    with process_pool(max_workers) as executor:
+        results = list(executor.map(run, tasks))
+
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, 'sweep.json'), 'w') as f:
+        json.dump(results, f, indent=2)
+    return results
+
+def main(argv=None):
+    """
+    コンソールから実行する
+    ======
+    $ kkgw-sweep config.py --workers 8 --seed 0 --solver newton
+
+    config.py では CFG(引数なしで作れるクラス), make_equation(cfg), GRID を定義する
+    """
+    parser = argparse.ArgumentParser(description='parameter sweep on top of Calc1d')
+    parser.add_argument('config', help='CFG, make_equation, GRID を定義した設定ファイル')
+    parser.add_argument('--grid', default=None, help='GRID の代わりに使う JSON 文字列または JSON ファイル')
+    parser.add_argument('--output-dir', default=None)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--solver', choices=['newton', 'chord'], default=None)
+    parser.add_argument('--fuse', action='store_true')
+    args = parser.parse_args(argv)
+
+    if args.grid is None:
+        grid = load_config(args.config).GRID
+    elif os.path.isfile(args.grid):
+        with open(args.grid) as f:
+            grid = json.load(f)
+    else:
+        grid = json.loads(args.grid)
+
+    results = sweep(
+        grid,
+        config=args.config,
+        output_dir=args.output_dir,
+        max_workers=args.workers,
+        seed=args.seed,
+        solver=args.solver,
+        fuse=args.fuse,
+    )
+    for result in results:
+        print(f"{result['output_dir']}: {result['elapsed']:.2f}s")
@@ -1,16 +1,35 @@
 import os
 import json
+import subprocess
+import sys
+from types import SimpleNamespace
 
 import numpy as np
-import matplotlib.pyplot as plt 
-import matplotlib.pylab as p
-from mpl_toolkits.mplot3d import Axes3D 
-from matplotlib import animation, rc
 
-from io import BytesIO
-from PIL import Image
+from .Storage import TrajectoryStore
+from .Sweep import process_pool
+
+# matplotlib と PIL は描くときに初めて読み込む(計算だけのプロセスの起動を速くするため)
+
+def headless() -> bool:
+    """ ディスプレイのない環境か """
+    if sys.platform.startswith('linux'):
+        return not (os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY'))
+    return False
+
+def pyplot():
+    """
+    matplotlib.pyplot を読み込む
+    ディスプレイのない環境では(MPLBACKEND で指定していなければ)非対話的な Agg を使う
+    """
+    if 'matplotlib.pyplot' not in sys.modules and headless() and not os.environ.get('MPLBACKEND'):
+        import matplotlib
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
 
 def close_fig(fig, close):
+    plt = pyplot()
     if close:
         plt.close(fig)
     else:
@@ -23,8 +42,12 @@ class Plot2d():
         os.makedirs(OUTPUT_FIG, exist_ok=True)
         self.output_fig = OUTPUT_FIG
 
-    def snapshot(self, fpl, name:str, time, close=True):
-        """ 各時刻での空間x関数のグラフ """
+    def snapshot(self, fpl, name:str, time, close=True, x=None):
+        """
+        各時刻での空間x関数のグラフ
+        x: 各点の格子点の番号 (省略時は 0, 1, 2, ...)
+        """
+        plt = pyplot()
         OUTPUT_FIG_plot = os.path.join(self.output_fig, name)
         os.makedirs(OUTPUT_FIG_plot, exist_ok=True)
 
@@ -34,17 +57,38 @@ class Plot2d():
             xlabel='Position',
             ylabel=name
         )
-        x = list(range(0, fpl.size))
+        x = list(range(0, fpl.size)) if x is None else x
         ax.plot(x, fpl)
         fig.savefig(os.path.join(OUTPUT_FIG_plot, f't={time}.png'))
         close_fig(fig, close)
 
+    def snapshots(self, varname: str, inittime: int = None, timespan: int = None, close=True):
+        """
+        TrajectoryStore に保存した各時刻の解をすべて snapshot で描く
+        (保存の方針で空間方向に間引いた解は元の格子点の位置に描く)
+        """
+        stop = None if timespan is None else (inittime or 0) + timespan
+        with TrajectoryStore(os.path.join(self.output_dir, 'var'), varname) as store:
+            steps, times, data = store.window(inittime, stop)
+            x = store.positions() if store.header is not None else None
+            for time, fpl in zip(times, data):
+                self.snapshot(np.asarray(fpl), varname, round(float(time), 12), close=close, x=x)
+
     def timeseries(self, varname: str, timeset: dict, close=True):
-        fpl = np.load(os.path.join(self.output_dir, 'var', f'{varname}.npy'))
+        plt = pyplot()
+        output_var = os.path.join(self.output_dir, 'var')
+        if TrajectoryStore.exists(output_var, varname):
+            # Diagnostics が記録した時系列を記録した時刻に対して描く
+            with TrajectoryStore(output_var, varname) as store:
+                steps, times, data = store.window()
+                t, fpl = np.array(times), np.asarray(data[:, 0])
+        else:
+            # 旧形式: brank ごとの値
+            fpl = np.load(os.path.join(output_var, f'{varname}.npy'))
+            t = np.linspace(timeset['inittime'], int(timeset['timespan']*timeset['Dt']), int(timeset['timespan']/timeset['brank'])+1)
 
         fig = plt.figure(figsize=(6,5), facecolor='w')
         ax = fig.add_subplot(111)
-        t = np.linspace(timeset['inittime'], int(timeset['timespan']*timeset['Dt']), int(timeset['timespan']/timeset['brank'])+1)
         plt.plot(t, fpl, color='r')
         ax.set_xlabel('time')
         ax.set_ylabel(varname)
@@ -56,7 +100,8 @@ class Anim2d():
     """
     フォルダ階層
     {output_dir}---var---{varname}.npy
-                 |     |-{varname}---t=0.npy <-
+                 |     |-{varname}.dat, {varname}.idx, {varname}.json <- TrajectoryStore
+                 |     |-{varname}---t=0.npy <- 旧形式
                  |-fig
                  |-settings.json
     """
@@ -104,40 +149,403 @@ class Anim2d():
             print('error')
 
 
-    def animation(self, varname: str, ylim=[-1,1], ext='mp4'):
-        """ アニメのプロット """
-        N = self.settings['N']
-        Dx = self.settings['Dx']
-        Dt = self.settings['Dt']
+    def animation(self, varname: str, ylim=[-1,1], ext='mp4', workers: int = 1, chunk: int = None):
+        """
+        アニメのプロット
+        1つの図と線を使い回して1コマずつエンコーダーに流すので、メモリ使用量はコマ数によらない (render)
+        Parameter
+        ---------
+        workers: int
+            2 以上ならコマを chunk 枚ずつに分けてプロセスプールで並列に描き、最後に連結する
+            (mp4 などの連結には ffmpeg を使う)
+        chunk: int
+            1つのプロセスで描くコマ数 (省略時はコマ数を workers 等分)
+        """
         inittime = self.timeset['plt_inittime']
         timespan = self.timeset['plt_timespan']
         brank = self.timeset['brank']
 
+        path = os.path.join(self.output_fig, f'{varname}.{ext}')
+        steps = self.frame_steps(varname, inittime, timespan, brank)
+        if workers <= 1 or len(steps) <= 1:
+            self.render(varname, steps, path, ylim)
+            return
+
+        chunk = -(-len(steps) // workers) if chunk is None else chunk
+        cfg = {'settings': self.settings, 'timeset': self.timeset, 'output_dir': self.output_dir}
+        tasks = []
+        for idx, start in enumerate(range(0, len(steps), chunk)):
+            part = os.path.join(self.output_fig, f'.{varname}.part{idx:04d}.{ext}')
+            tasks.append((cfg, varname, steps[start:start+chunk], part, ylim))
+
+        with process_pool(workers) as executor:
+            parts = list(executor.map(_render_chunk, tasks))
+        try:
+            concat_animation(parts, path)
+        finally:
+            for part in parts:
+                if os.path.exists(part):
+                    os.remove(part)
+
+    def render(self, varname: str, steps: list, path: str, ylim=[-1,1], interval: int = 100):
+        """
+        時刻ステップ steps の解のアニメを path に保存する
+        線と時刻の表示を set_data で書き換えながら1コマずつ writer に渡し、描いたコマは保持しない
+        (gif の Pillow writer だけは最後にまとめて書くのでコマを保持する)
+        """
+        plt = pyplot()
+        import matplotlib as mpl
+        from matplotlib import animation
+        N = self.settings['N']
+        Dx = self.settings['Dx']
+        Dt = self.settings['Dt']
+
         fig, ax = plt.subplots(figsize=(6,5), facecolor='w')
-        ims = []
         x = np.linspace(0, int(N*Dx)+1, N)
-        for time in range(inittime, inittime+timespan+1, brank):
-            fpl = np.load(os.path.join(self.output_var, varname, f't={round(time*Dt, self.dig)}.npy'))
-            img = ax.plot(x, fpl, c='r') # グラフを作成
-            ax.set_ylim(ylim)
-            title = ax.text(0.5, 1.01, f'time={round(time*Dt, self.dig)}',
-                    ha='center', va='bottom',
-                    transform=ax.transAxes, fontsize='large')
-        
-            ims.append(img+[title]) # グラフを配列に追加 
+        if TrajectoryStore.exists(self.output_var, varname):
+            # 保存の方針で空間方向に間引いた解は元の格子点の位置に描く
+            with TrajectoryStore(self.output_var, varname) as store:
+                x = x[store.positions()]
+        line, = ax.plot(x, np.zeros(len(x)), c='r')
+        ax.set_ylim(ylim)
+        title = ax.text(0.5, 1.01, '',
+                ha='center', va='bottom',
+                transform=ax.transAxes, fontsize='large')
 
+        # Animation.save と同じく、既定の writer がなければ Pillow を使う
+        name = mpl.rcParams['animation.writer']
+        if not animation.writers.is_available(name):
+            name = 'pillow'
         # 1000*Dt[ms] ごとに表示
-        ani = animation.ArtistAnimation(fig, ims, interval=100)
-        ani.save(os.path.join(self.output_fig, f'{varname}.{ext}'))
+        writer = animation.writers[name](fps=1000/interval)
+        with writer.saving(fig, path, dpi=fig.dpi):
+            for time, fpl in self.frames(varname, steps):
+                line.set_data(x, fpl)
+                title.set_text(f'time={round(time*Dt, self.dig)}')
+                writer.grab_frame()
+        plt.close(fig)
+
+    def frame_steps(self, varname: str, inittime: int, timespan: int, brank: int) -> list:
+        """ 時刻ステップ inittime から brank ごとの、アニメに描く時刻ステップ """
+        if TrajectoryStore.exists(self.output_var, varname):
+            with TrajectoryStore(self.output_var, varname) as store:
+                steps = np.array(store.window(inittime, inittime+timespan)[0])
+            return [int(step) for step in steps[(steps - inittime) % brank == 0]]
+        # 1ステップ1ファイルの旧形式
+        return list(range(inittime, inittime+timespan+1, brank))
+
+    def frames(self, varname: str, steps: list):
+        """ 時刻ステップ steps の (時刻ステップ, 解) を順に返す """
+        Dt = self.settings['Dt']
+
+        if TrajectoryStore.exists(self.output_var, varname):
+            with TrajectoryStore(self.output_var, varname) as store:
+                for time in steps:
+                    yield time, store.load(time)
+        else:
+            # 1ステップ1ファイルの旧形式
+            for time in steps:
+                yield time, np.load(os.path.join(self.output_var, varname, f't={round(time*Dt, self.dig)}.npy'))
+
+def _render_chunk(task) -> str:
+    """ Anim2d.animation の並列描画で、1つのプロセスが受け持つコマを描く """
+    cfg, varname, steps, path, ylim = task
+    import matplotlib
+    matplotlib.use('Agg')
+    Anim2d(SimpleNamespace(**cfg)).render(varname, steps, path, ylim)
+    return path
+
+def concat_animation(parts: list, path: str):
+    """
+    分けて保存したアニメを順に連結して path に保存する
+    gif は Pillow で1コマずつ読み直し、それ以外は ffmpeg の concat で再エンコードせずにつなぐ
+    """
+    import matplotlib as mpl
+    from PIL import Image, ImageSequence
+
+    if path.endswith('.gif'):
+        durations = []
+        def images():
+            for part in parts:
+                with Image.open(part) as im:
+                    for frame in ImageSequence.Iterator(im):
+                        durations.append(frame.info.get('duration', 100))
+                        yield frame.convert('RGB')
+        seq = images()
+        first = next(seq)
+        first.save(path, save_all=True, append_images=seq, duration=durations[0], loop=0)
+        return
+
+    listfile = path + '.txt'
+    with open(listfile, 'w') as f:
+        for part in parts:
+            f.write(f"file '{os.path.abspath(part)}'\n")
+    try:
+        subprocess.run(
+            [mpl.rcParams['animation.ffmpeg_path'], '-y', '-loglevel', 'error',
+             '-f', 'concat', '-safe', '0', '-i', listfile, '-c', 'copy', path],
+            check=True,
+        )
+    finally:
+        os.remove(listfile)
+
+def lttb(x, y, n: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets で折れ線 (x, y) から n 点を選んだ番号
+    各区間で、前に選んだ点と次の区間の平均とで作る三角形が最大になる点を残すので、鋭い変化が消えない
+    """
+    N = len(y)
+    if n >= N or n < 3:
+        return np.arange(N)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, N-1, n-1).astype(int) # 最初と最後の点を除いた n-2 個の区間
+    index = np.empty(n, dtype=int)
+    index[0], index[-1] = 0, N-1
+    for i in range(n-2):
+        lo, hi = edges[i], edges[i+1]
+        if i+2 < n-1:
+            cx, cy = x[hi:edges[i+2]].mean(), y[hi:edges[i+2]].mean()
+        else:
+            cx, cy = x[N-1], y[N-1]
+        px, py = x[index[i]], y[index[i]]
+        area = np.abs((px-cx)*(y[lo:hi]-py) - (px-x[lo:hi])*(cy-py))
+        index[i+1] = lo + int(area.argmax())
+    return index
+
+def decimate(a, n: int, axis: int = -1, method: str = 'minmax'):
+    """
+    配列 a の axis 方向を n 点程度に減らす
+    method
+    ======
+    'minmax': 区間ごとの最小値と最大値の2点 (界面などの鋭い変化が残る)
+    'mean': 区間ごとの平均
+    'stride': 区間の最初の点
+    Return
+    ------
+    (減らした配列, 各点の元の番号)
+    """
+    a = np.moveaxis(np.asarray(a), axis, 0)
+    length = len(a)
+    nblock = n//2 if method == 'minmax' else n
+    if length <= n or nblock < 1:
+        return np.moveaxis(a, 0, axis), np.arange(length)
+    edges = np.linspace(0, length, nblock+1).astype(int)
+    starts = edges[:-1]
+    if method == 'stride':
+        output, index = a[starts], starts
+    elif method == 'mean':
+        output, index = np.add.reduceat(a, starts, axis=0) / np.diff(edges).reshape((-1,) + (1,)*(a.ndim-1)), starts
+    else:
+        # 最小値と最大値を交互に並べ、番号は区間の最初と中央にする
+        lo = np.minimum.reduceat(a, starts, axis=0)
+        hi = np.maximum.reduceat(a, starts, axis=0)
+        output = np.stack([lo, hi], axis=1).reshape((2*nblock,) + a.shape[1:])
+        index = np.stack([starts, (starts + edges[1:])//2], axis=1).ravel()
+    return np.moveaxis(output, 0, axis), index
+
+def rotation_frames(fig, ax, angles, elev: float = 30, offset: float = 135) -> list:
+    """
+    3D の図 fig を、軸 ax の視点だけ変えながら描き直した PIL Image のリスト
+    (図を作り直さないので、角度ごとの図の作成と保存の分だけ速い)
+    """
+    from PIL import Image
+
+    images = []
+    for angle in angles:
+        ax.view_init(elev, angle+offset)
+        fig.canvas.draw()
+        images.append(Image.fromarray(np.asarray(fig.canvas.buffer_rgba())).convert('RGB'))
+    return images
+
+class SpaceTime():
+    """
+    保存した解の時空間図 (横軸が位置、縦軸が時刻のヒートマップ) と回転する 3D 曲面
+    TrajectoryStore の memmap を時間方向に少しずつ読みながら間引くので、全体をメモリに読み込まない
+    図は1つを使い回す
+
+    st = SpaceTime(output_dir, Dx=0.5)
+    st.heatmap()          # {output_dir}/fig/{varname}_spacetime.png
+    st.rotation()         # {output_dir}/fig/{varname}_spacetime.gif
+    st.trace(50)          # {output_dir}/fig/{varname}_trace_x=50.png
+    """
+
+    def __init__(
+        self,
+        output_dir: str = './data/output',
+        varname: str = 'U',
+        Dx: float = 1.0,
+        inittime: int = None,
+        timespan: int = None,
+        section=None,
+        method: str = 'minmax',
+        chunk_bytes: int = 64*1024**2,
+    ):
+        """
+        Parameter
+        ---------
+        inittime, timespan:
+            描く時刻ステップの範囲 (省略時は全部)
+        section:
+            2次元の解 (Calc2d) から1次元の断面を取り出す関数 (rows, Nx, Ny) -> (rows, Nx)
+            省略時は y 方向の中央の断面
+        method: str
+            decimate の間引き方
+        chunk_bytes: int
+            1回に読み込む大きさの目安[バイト]
+        """
+        self.output_dir = output_dir
+        self.output_var = os.path.join(output_dir, 'var')
+        self.varname = varname
+        self.Dx = Dx
+        self.inittime = inittime
+        self.stop = None if timespan is None else (inittime or 0) + timespan
+        self.section = section
+        self.method = method
+        self.chunk_bytes = chunk_bytes
+        OUTPUT_FIG = os.path.join(output_dir, 'fig')
+        os.makedirs(OUTPUT_FIG, exist_ok=True)
+        self.output_fig = OUTPUT_FIG
+        self.fig = None
+        self.cache = {} # (nt, nx) -> grid の結果
+
+    def cut(self, rows) -> np.ndarray:
+        """ 読み込んだ行を (rows, 位置) の2次元配列にする """
+        rows = np.asarray(rows, dtype=float)
+        if rows.ndim <= 2:
+            return rows
+        if self.section is not None:
+            return np.asarray(self.section(rows), dtype=float)
+        return rows[..., rows.shape[-1]//2]
+
+    def chunks(self, data, lo: int, hi: int):
+        """ data[lo:hi] を chunk_bytes 程度ずつ読む """
+        row_bytes = max(1, int(np.prod(data.shape[1:])) * data.dtype.itemsize)
+        step = max(1, self.chunk_bytes // row_bytes)
+        for start in range(lo, hi, step):
+            yield self.cut(data[start:min(start+step, hi)])
+
+    def grid(self, nt: int = 1000, nx: int = 1000):
+        """
+        時間方向 nt 行、空間方向 nx 列程度に間引いた解
+        Return
+        ------
+        (時刻の配列, 位置の配列, (時刻, 位置) の配列)
+        """
+        if (nt, nx) in self.cache:
+            return self.cache[(nt, nx)]
+        reduce = {'minmax': (np.minimum, np.maximum), 'mean': (np.add,), 'stride': ()}[self.method]
+
+        with TrajectoryStore(self.output_var, self.varname) as store:
+            steps, times, data = store.window(self.inittime, self.stop)
+            times = np.array(times)
+            T = len(times)
+            if T == 0:
+                raise ValueError(f'{self.varname}: no records between steps {self.inittime} and {self.stop}')
+            # 保存の方針で空間方向に間引いた解は元の格子点の番号に直す
+            positions = store.positions()
+            nblock = min(T, nt//2 if self.method == 'minmax' else nt)
+            edges = np.linspace(0, T, nblock+1).astype(int)
+
+            rows, tindex = [], []
+            for lo, hi in zip(edges[:-1], edges[1:]):
+                if self.method == 'stride':
+                    block = [self.cut(data[lo:lo+1])[0]]
+                else:
+                    block = None
+                    for part in self.chunks(data, lo, hi):
+                        values = [ufunc.reduce(part, axis=0) for ufunc in reduce]
+                        block = values if block is None else [ufunc(b, v) for ufunc, b, v in zip(reduce, block, values)]
+                    if self.method == 'mean':
+                        block = [block[0] / (hi-lo)]
+                # 時間方向に減らした行を空間方向にも減らす
+                for row in block:
+                    row, xindex = decimate(row, nx, method=self.method)
+                    rows.append(row)
+                tindex.extend([lo, (lo+hi)//2][:len(block)])
+
+        output = (times[np.minimum(tindex, T-1)], positions[xindex]*self.Dx, np.array(rows))
+        self.cache[(nt, nx)] = output
+        return output
+
+    def figure(self, projection=None):
+        """ 使い回す図 (前の内容は消す) """
+        plt = pyplot()
+        if self.fig is None:
+            self.fig = plt.figure(figsize=(6,5), facecolor='w')
+        self.fig.clf()
+        return self.fig, self.fig.add_subplot(111, projection=projection)
+
+    def heatmap(self, nt: int = 1000, nx: int = 1000, cmap: str = 'RdBu_r', vmin=None, vmax=None, path: str = None) -> str:
+        """ 時空間図を保存する (縦軸が時刻) """
+        T, X, Z = self.grid(nt, nx)
+        fig, ax = self.figure()
+        image = ax.imshow(
+            Z, aspect='auto', origin='lower', cmap=cmap, vmin=vmin, vmax=vmax, interpolation='nearest',
+            extent=(X[0], X[-1], T[0], T[-1]),
+        )
+        fig.colorbar(image, ax=ax, label=self.varname)
+        ax.set_xlabel('Position')
+        ax.set_ylabel('time')
+        path = os.path.join(self.output_fig, f'{self.varname}_spacetime.png') if path is None else path
+        fig.savefig(path)
+        return path
+
+    def rotation(self, nt: int = 64, nx: int = 64, angles=range(0, 360, 10), duration: int = 100, cmap: str = 'RdBu_r', path: str = None) -> str:
+        """ 時空間の 3D 曲面を回転させながら描いた GIF を保存する """
+        T, X, Z = self.grid(nt, nx)
+        fig, ax = self.figure(projection='3d')
+        XX, TT = np.meshgrid(X, T)
+        ax.plot_surface(XX, TT, Z, cmap=cmap, linewidth=0, antialiased=False)
+        ax.set_xlabel('Position')
+        ax.set_ylabel('time')
+        ax.set_zlabel(self.varname)
+        images = rotation_frames(fig, ax, angles)
+        path = os.path.join(self.output_fig, f'{self.varname}_spacetime.gif') if path is None else path
+        images[0].save(path, save_all=True, append_images=images[1:], duration=duration, loop=0)
+        return path
+
+    def trace(self, position: int, n: int = 2000, path: str = None) -> str:
+        """ 格子点 position での解の時間変化 (LTTB で n 点に間引く) を保存する """
+        with TrajectoryStore(self.output_var, self.varname) as store:
+            steps, times, data = store.window(self.inittime, self.stop)
+            times = np.array(times)
+            if len(times) == 0:
+                raise ValueError(f'{self.varname}: no records between steps {self.inittime} and {self.stop}')
+            # 空間方向に間引いて保存したときは保存した点の番号に直す
+            column = int(np.searchsorted(store.positions(), position))
+            if column >= store.shape[0] or store.positions()[column] != position:
+                raise ValueError(f'{self.varname}: grid point {position} is not stored (stride {store.policy["stride"]})')
+            values = np.concatenate([part[:, column] for part in self.chunks(data, 0, len(times))])
+        index = lttb(times, values, n)
+        fig, ax = self.figure()
+        ax.plot(times[index], values[index], color='r')
+        ax.set_xlabel('time')
+        ax.set_ylabel(self.varname)
+        ax.set_title(f'x={position*self.Dx}')
+        path = os.path.join(self.output_fig, f'{self.varname}_trace_x={position}.png') if path is None else path
+        fig.savefig(path)
+        return path
+
+    def close(self):
+        if self.fig is not None:
+            pyplot().close(self.fig)
+            self.fig = None
 
 class plot3d():
-    def functz(Upl):
-        global X, Y
+    def functz(Upl, X=None, Y=None):
+        """ 格子点の番号 X, Y での値 (省略時はグローバル変数の X, Y) """
+        if X is None or Y is None:
+            X, Y = globals()['X'], globals()['Y']
         z = Upl[X, Y]
         return z
 
-    def render_frame(X, Y, Z, angle):
+    def render_frame(X, Y, Z, angle, labels=('Position', 'time', 'Temperature')):
         """3DグラフをPkLkmageに変換して返す"""
+        from io import BytesIO
+        from PIL import Image
+
+        plt = pyplot()
         fig = plt.figure(figsize=(6,5), facecolor='w')
         ax = fig.add_subplot(111, projection='3d')
         # ax = Axes3D(fig)
@@ -145,12 +553,61 @@ class plot3d():
         ax.view_init(30, angle+135)
         plt.close()
         # 軸の設定
-        ax.set_xlabel('Position')
-        ax.set_ylabel('time')
-        ax.set_zlabel('Temperature')
+        ax.set_xlabel(labels[0])
+        ax.set_ylabel(labels[1])
+        ax.set_zlabel(labels[2])
         # PIL Image に変換
         buf = BytesIO()
         fig.savefig(buf, bbox_inches='tight', pad_inches=0.0)
         return Image.open(buf)
 
+    def grid(Upl, Dx=1.0, Dy=None, stride=None):
+        """
+        (Nx, Ny) の解から render_frame に渡す X, Y, Z
+        stride を省略すると各方向 64 点程度に間引く
+        """
+        Nx, Ny = np.shape(Upl)
+        Dy = Dx if Dy is None else Dy
+        stride = max(1, max(Nx, Ny)//64) if stride is None else stride
+        I, J = np.meshgrid(np.arange(0, Nx, stride), np.arange(0, Ny, stride), indexing='ij')
+        return I*Dx, J*Dy, plot3d.functz(np.asarray(Upl), I, J)
+
+    def snapshots(output_dir: str, varname='U', inittime=None, timespan=None, Dx=1.0, Dy=None, angle=0, stride=None):
+        """
+        Calc2d が TrajectoryStore に保存した各時刻の解の 3D グラフ
+        {output_dir}/fig/{varname}_3d/t={time}.png に保存する
+        """
+        OUTPUT_FIG_plot = os.path.join(output_dir, 'fig', f'{varname}_3d')
+        os.makedirs(OUTPUT_FIG_plot, exist_ok=True)
+        stop = None if timespan is None else (inittime or 0) + timespan
+        with TrajectoryStore(os.path.join(output_dir, 'var'), varname) as store:
+            steps, times, data = store.window(inittime, stop)
+            for time, Upl in zip(times, data):
+                X, Y, Z = plot3d.grid(Upl, Dx, Dy, stride)
+                img = plot3d.render_frame(X, Y, Z, angle, labels=('x', 'y', varname))
+                img.save(os.path.join(OUTPUT_FIG_plot, f't={round(float(time), 12)}.png'))
 
+    def rotation(output_dir: str, varname='U', step=None, Dx=1.0, Dy=None, angles=range(0, 360, 10), stride=None, duration=100):
+        """
+        時刻ステップ step (省略時は最後) の解を回転させながら描いた GIF
+        {output_dir}/fig/{varname}_3d/rotation_step={step}.gif に保存する
+        """
+        OUTPUT_FIG_plot = os.path.join(output_dir, 'fig', f'{varname}_3d')
+        os.makedirs(OUTPUT_FIG_plot, exist_ok=True)
+        with TrajectoryStore(os.path.join(output_dir, 'var'), varname) as store:
+            step = int(store.steps[-1]) if step is None else step
+            X, Y, Z = plot3d.grid(store.load(step), Dx, Dy, stride)
+        # 図は1つだけ作って視点だけ変える
+        plt = pyplot()
+        fig = plt.figure(figsize=(6,5), facecolor='w')
+        ax = fig.add_subplot(111, projection='3d')
+        ax.plot_wireframe(X, Y, Z, color='r')
+        ax.set_xlabel('x')
+        ax.set_ylabel('y')
+        ax.set_zlabel(varname)
+        images = rotation_frames(fig, ax, angles)
+        plt.close(fig)
+        images[0].save(
+            os.path.join(OUTPUT_FIG_plot, f'rotation_step={step}.gif'),
+            save_all=True, append_images=images[1:], duration=duration, loop=0,
+        )
@@ -10,10 +10,9 @@ setup(
     description = 'My function storage',
     install_requires = ['setuptools'],
     packages = ["kkgw", "kkgw.utils", "kkgw.math"],
-    # entry_points = {
-    #     'console_scripts': [
-    #         'top = kkgw.top:main',
-    #         'bottom = kkgw.utils.bottom:sub'
-    #     ]
-    # }
+    entry_points = {
+        'console_scripts': [
+            'kkgw-sweep = kkgw.math.Sweep:main',
+        ]
+    }
 )
\ No newline at end of file
@@ -0,0 +1,33 @@
+import os
+
+import numpy as np
+
+from kkgw.math.DifferentialEquation import CahnHilliardEq_NeumannBC_1d_DVDM
+from kkgw.math.Simulation import Calc1d
+from kkgw.math.Solver import NewtonSolver, StepSizeController
+from kkgw.math.Storage import TrajectoryStore
+
+N = 30
+
+class CFG():
+    def __init__(self, output_dir: str, timespan: int = 100):
+        self.settings = {'N': N+4, 'Dx': 0.5, 'Dt': 0.1}
+        self.params = {'Gamma': 2, 'const': 0.25}
+        self.timeset = {'inittime': 0, 'timespan': timespan, 'brank': 10, 'plt_inittime': 0, 'plt_timespan': timespan}
+        self.output_dir = output_dir
+
+    def initialdata(self, idx):
+        return 0.1*np.cos(4*np.pi*idx/(N+4))
+
+def test_dtmax_equal_to_save_interval(tmp_path):
+    # 刻み幅が Dt で頭打ちのとき、浮動小数点の足し算の残り (1e-16 程度) を dtmin 未満の刻みとして扱わない
+    cfg = CFG(str(tmp_path))
+    calc = Calc1d(cfg)
+    calc.preparation()
+    ch = CahnHilliardEq_NeumannBC_1d_DVDM(dict(cfg.settings, N=N), cfg.params)
+    calc.calc_adaptive(ch.equation, solver=NewtonSolver(), controller=StepSizeController(tol=1e-3, dtmax=0.1))
+
+    with TrajectoryStore(os.path.join(cfg.output_dir, 'var'), 'U') as store:
+        np.testing.assert_array_equal(store.steps, [0, 1] + list(range(10, 101, 10)))
+        np.testing.assert_allclose(store.times, store.steps*0.1)
+        assert np.isfinite(np.asarray(store.data)).all()
@@ -0,0 +1,67 @@
+import os
+import tempfile
+
+import numpy as np
+
+from kkgw.math.Cache import RunCache
+from kkgw.math.DifferentialEquation import CahnHilliardEq_NeumannBC_1d_DVDM
+from kkgw.math.Solver import NewtonSolver
+from kkgw.math.Storage import TrajectoryStore
+
+N = 30
+
+class CFG():
+    def __init__(self, timespan: int = 30):
+        self.settings = {'N': N+4, 'Dx': 0.5, 'Dt': 0.1}
+        self.params = {'Gamma': 2, 'const': 0.25}
+        self.timeset = {'inittime': 0, 'timespan': timespan, 'brank': 10, 'plt_inittime': 0, 'plt_timespan': timespan}
+        self.output_dir = None
+
+    def initialdata(self, idx):
+        return 0.1*np.cos(4*np.pi*idx/(N+4))
+
+def make_equation(cfg):
+    return CahnHilliardEq_NeumannBC_1d_DVDM(dict(cfg.settings, N=N), cfg.params).equation
+
+def trajectory(output_dir: str):
+    with TrajectoryStore(os.path.join(output_dir, 'var'), 'U') as store:
+        return np.array(store.steps), np.array(store.data)
+
+def test_orphan_directory_is_replaced(tmp_path):
+    cache = RunCache(str(tmp_path))
+    calc, status = cache.run(CFG(), make_equation, solver=NewtonSolver())
+    assert status == 'new'
+    key = os.path.basename(calc.output_dir)
+    steps, data = trajectory(calc.output_dir)
+
+    # cache.json を書く前に止まった計算の代わり
+    os.remove(os.path.join(cache.path(key), 'cache.json'))
+    open(os.path.join(cache.path(key), 'junk'), 'w').close()
+    assert cache.entries() == {}
+
+    calc, status = cache.run(CFG(), make_equation, solver=NewtonSolver())
+    assert status == 'new'
+    assert not os.path.exists(os.path.join(cache.path(key), 'junk'))
+    assert list(cache.entries()) == [key]
+    steps_again, data_again = trajectory(calc.output_dir)
+    np.testing.assert_array_equal(steps_again, steps)
+    np.testing.assert_array_equal(data_again, data)
+
+    _, status = cache.run(CFG(), make_equation, solver=NewtonSolver())
+    assert status == 'hit'
+
+def test_install_keeps_complete_entry(tmp_path):
+    cache = RunCache(str(tmp_path))
+    calc, _ = cache.run(CFG(), make_equation, solver=NewtonSolver())
+    key = os.path.basename(calc.output_dir)
+
+    # 同時に同じ計算が終わっていたときはそちらを使い、staging は置かない
+    staging = tempfile.mkdtemp(prefix='.staging-', dir=cache.root)
+    open(os.path.join(staging, 'marker'), 'w').close()
+    assert cache.install(staging, key, 30) == cache.meta(key)
+    assert not os.path.exists(os.path.join(cache.path(key), 'marker'))
+
+    # 保存済みより長い計算は置き換える
+    assert cache.install(staging, key, 40) is None
+    assert os.path.exists(os.path.join(cache.path(key), 'marker'))
+    assert not any(name.startswith('.trash-') for name in os.listdir(cache.root))
@@ -0,0 +1,80 @@
+import os
+
+import numpy as np
+import pytest
+
+from kkgw.math.DifferentialEquation import CahnHilliardEq_NeumannBC_1d_DVDM
+from kkgw.math.Profiler import Observer
+from kkgw.math.Simulation import Calc1d
+from kkgw.math.Solver import NewtonSolver
+from kkgw.math.Storage import Checkpoint, TrajectoryStore
+
+N = 30
+
+class CFG():
+    def __init__(self, output_dir: str, timespan: int = 100):
+        self.settings = {'N': N+4, 'Dx': 0.5, 'Dt': 0.1}
+        self.params = {'Gamma': 2, 'const': 0.25}
+        self.timeset = {'inittime': 0, 'timespan': timespan, 'brank': 10, 'plt_inittime': 0, 'plt_timespan': timespan}
+        self.output_dir = output_dir
+
+    def initialdata(self, idx):
+        return 0.1*np.cos(4*np.pi*idx/(N+4))
+
+class Kill(Observer):
+    """ 時刻ステップ t の後で計算を止める (プロセスが落ちたときの代わり) """
+    def __init__(self, t: int):
+        self.t = t
+
+    def step(self, calc, info: dict):
+        if info['t'] == self.t:
+            raise KeyboardInterrupt
+
+def equation(cfg, params=None):
+    return CahnHilliardEq_NeumannBC_1d_DVDM(dict(cfg.settings, N=N), dict(params or cfg.params)).equation
+
+def trajectory(output_dir: str):
+    with TrajectoryStore(os.path.join(output_dir, 'var'), 'U') as store:
+        return np.array(store.steps), np.array(store.data)
+
+def test_kill_and_resume_is_exact(tmp_path):
+    cfg = CFG(str(tmp_path / 'reference'))
+    calc = Calc1d(cfg)
+    calc.preparation()
+    calc.calc(equation(cfg), solver=NewtonSolver(), checkpoint=15)
+
+    cfg = CFG(str(tmp_path / 'killed'))
+    calc = Calc1d(cfg)
+    calc.preparation()
+    with pytest.raises(KeyboardInterrupt):
+        calc.calc(equation(cfg), solver=NewtonSolver(), checkpoint=15, observers=[Kill(52)])
+    assert Checkpoint(cfg.output_dir).latest() == 45
+    Calc1d(cfg).calc(equation(cfg), solver=NewtonSolver(), checkpoint=15, resume=True)
+
+    steps, data = trajectory(str(tmp_path / 'reference'))
+    steps_resumed, data_resumed = trajectory(cfg.output_dir)
+    np.testing.assert_array_equal(steps_resumed, steps)
+    np.testing.assert_array_equal(data_resumed, data)
+
+def test_preparation_clears_checkpoints(tmp_path):
+    cfg = CFG(str(tmp_path), timespan=30)
+    calc = Calc1d(cfg)
+    calc.preparation()
+    calc.calc(equation(cfg), solver=NewtonSolver(), checkpoint=10)
+    assert Checkpoint(cfg.output_dir).latest() == 30
+
+    calc.preparation()
+    assert Checkpoint(cfg.output_dir).latest() is None
+    calc.calc(equation(cfg), solver=NewtonSolver(), checkpoint=10, resume=True)
+    steps, _ = trajectory(cfg.output_dir)
+    np.testing.assert_array_equal(steps, [0, 1, 10, 20, 30])
+
+def test_resume_refuses_other_configuration(tmp_path):
+    cfg = CFG(str(tmp_path), timespan=30)
+    calc = Calc1d(cfg)
+    calc.preparation()
+    calc.calc(equation(cfg), solver=NewtonSolver(), checkpoint=10)
+
+    cfg.timeset['timespan'] = 40
+    with pytest.raises(ValueError):
+        Calc1d(cfg).calc(equation(cfg, {'Gamma': 1, 'const': 0.25}), solver=NewtonSolver(), checkpoint=10, resume=True)
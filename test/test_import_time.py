@@ -0,0 +1,56 @@
+import os
+import statistics
+import subprocess
+import sys
+
+import pytest
+
+# numpy を読み込んだ後に kkgw のモジュールの import にかけてよい時間 (numpy の import 時間に対する比)
+IMPORT_BUDGET = {
+    'kkgw.math.Simulation': 1.0,
+    'kkgw.math.Sweep': 1.0,
+    'kkgw.math.Visualization': 1.0,
+}
+# 計算だけのプロセスでは import の時点で読み込まれてはいけないライブラリ
+HEAVY_MODULES = ('scipy', 'matplotlib', 'PIL')
+REPEAT = 5
+
+def import_time(module: str) -> dict:
+    """
+    新しいインタープリタで numpy と module を順に import する時間
+    Return
+    ------
+    {'numpy': 秒, 'module': 秒, 'heavy': import の時点で読み込まれた HEAVY_MODULES} (REPEAT 回の中央値)
+    """
+    code = (
+        'import sys, time\n'
+        't = time.perf_counter()\n'
+        'import numpy\n'
+        'print(time.perf_counter() - t)\n'
+        't = time.perf_counter()\n'
+        f'import {module}\n'
+        'print(time.perf_counter() - t)\n'
+        f'print(",".join(m for m in {HEAVY_MODULES!r} if m in sys.modules))\n'
+    )
+    # インストールしていなくても、このリポジトリのパッケージを読み込む
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get('PYTHONPATH')])))
+
+    numpy_times, module_times = [], []
+    for _ in range(REPEAT):
+        proc = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, env=env, check=True)
+        lines = proc.stdout.splitlines()
+        numpy_times.append(float(lines[0]))
+        module_times.append(float(lines[1]))
+        heavy = [m for m in lines[2].split(',') if m] if len(lines) > 2 else []
+    return {'numpy': statistics.median(numpy_times), 'module': statistics.median(module_times), 'heavy': heavy}
+
+@pytest.mark.parametrize('module', list(IMPORT_BUDGET))
+def test_import_budget(module):
+    result = import_time(module)
+    limit = IMPORT_BUDGET[module] * result['numpy']
+    assert result['module'] <= limit, f"{module}: import took {result['module']:.3f}s after numpy (budget {limit:.3f}s)"
+
+@pytest.mark.parametrize('module', list(IMPORT_BUDGET))
+def test_no_heavy_imports(module):
+    assert import_time(module)['heavy'] == [], f'{module} imports heavy libraries at load time'
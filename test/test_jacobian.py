@@ -0,0 +1,46 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from kkgw.math import DifferentialEquation as DE
+
+N = 12
+SETTINGS = {'N': N, 'Dx': 0.5, 'Dt': 0.1}
+PARAMS = {'Gamma': 2, 'const': 0.25}
+
+def make_scheme(name: str):
+    """ (方程式クラスのインスタンス, 解の長さ) """
+    if name.startswith('HeatEq'):
+        cfg = SimpleNamespace(settings=dict(SETTINGS), params=dict(PARAMS))
+        return getattr(DE, name)(cfg), N
+    return getattr(DE, name)(dict(SETTINGS), dict(PARAMS)), N+4
+
+def finite_difference(fun, U2, U1, h: float = 1e-6) -> np.ndarray:
+    """ fun(U2, U1) の U2 についてのヤコビ行列の中心差分近似 """
+    J = np.zeros((len(U2), len(U2)))
+    for j in range(len(U2)):
+        V = U2.copy()
+        V[j] += h
+        Fp = np.array(fun(V, U1), dtype=float)
+        V[j] -= 2*h
+        Fm = np.array(fun(V, U1), dtype=float)
+        J[:, j] = (Fp - Fm) / (2*h)
+    return J
+
+@pytest.mark.parametrize('name', [
+    'CahnHilliardEq_NeumannBC_1d_DVDM',
+    'CahnHilliardEq_NeumannBC_1d_Stabilized',
+    'CahnHilliardEq_NeumannBC_1d_FwdEuler',
+    'HeatEq_NeumannBC_1d_DVDM',
+    'HeatEq_ReactionBC_1d_DVDM',
+])
+def test_jacobian_matches_finite_difference(name):
+    scheme, n = make_scheme(name)
+    rng = np.random.default_rng(0)
+    U1 = 0.3*rng.standard_normal(n)
+    U2 = 0.3*rng.standard_normal(n)
+    J = scheme.jacobian(U2, U1).toarray()
+    J_fd = finite_difference(scheme.equation, U2, U1)
+    assert J.shape == (n, n)
+    assert np.abs(J - J_fd).max() <= 1e-6 * (1 + np.abs(J_fd).max())
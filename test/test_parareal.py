@@ -0,0 +1,13 @@
+import pytest
+
+from kkgw.math.Parareal import slice_bounds
+
+@pytest.mark.parametrize('coarse_dt, Dt, expected', [
+    (0.07, 0.01, [0, 49, 105, 161, 210]), # 0.07/0.01 = 7.000000000000001
+    (0.3, 0.1, [0, 51, 105, 159, 210]), # 0.3/0.1 = 2.9999999999999996
+])
+def test_slice_bounds_snaps_inexact_ratio(coarse_dt, Dt, expected):
+    assert slice_bounds(0, 210, 4, coarse_dt/Dt) == expected
+
+def test_slice_bounds_without_integer_ratio():
+    assert slice_bounds(100, 210, 4, 2.5) == [100, 152, 205, 258, 310]
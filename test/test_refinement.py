@@ -0,0 +1,34 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from kkgw.math.DifferentialEquation import CahnHilliardEq_NeumannBC_1d_DVDM
+from kkgw.math.Refinement import refinement_study
+
+N = 17
+
+class CFG():
+    def __init__(self, output_dir: str):
+        self.settings = {'N': N+4, 'Dx': 1.0, 'Dt': 0.1}
+        self.params = {'Gamma': 2, 'const': 0.25}
+        self.timeset = {'inittime': 0, 'timespan': 20, 'brank': 10, 'plt_inittime': 0, 'plt_timespan': 20}
+        self.output_dir = output_dir
+
+    def initialdata(self, idx):
+        x = (idx-2)/(N-1)
+        return 0.3*np.cos(np.pi*x) + 0.1*np.cos(3*np.pi*x)
+
+def make_equation(cfg):
+    return CahnHilliardEq_NeumannBC_1d_DVDM(dict(cfg.settings, N=cfg.settings['N']-4), cfg.params).equation
+
+@pytest.mark.parametrize('refine', ['space', 'time'])
+def test_second_order_convergence(tmp_path, refine):
+    report = refinement_study(CFG(str(tmp_path)), make_equation, levels=3, refine=refine, max_workers=2)
+    assert [level['level'] for level in report['levels']] == [0, 1, 2]
+    assert abs(report['U']['orders'][0] - 2) < 0.2
+    # 質量は丸め誤差の範囲で保存されるので次数を出さない
+    assert report['mass']['orders'] == [None]
+    with open(os.path.join(str(tmp_path), 'refinement', 'refinement.json')) as f:
+        assert json.load(f)['refine'] == refine
@@ -0,0 +1,62 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from scipy import optimize
+
+from kkgw.math import DifferentialEquation as DE
+from kkgw.math.Solver import NewtonSolver, banded_lu, lu_solve
+
+N = 30
+SETTINGS = {'N': N, 'Dx': 0.5, 'Dt': 0.1}
+PARAMS = {'Gamma': 2, 'const': 0.25}
+
+def initial(n: int) -> np.ndarray:
+    """ 仮想点込みの長さ n+4 の初期値 (鏡映条件を満たす) """
+    U = 0.1*np.cos(4*np.pi*np.arange(n+4)/(n+4))
+    U[[0, 1, n+2, n+3]] = U[[4, 3, n, n-1]]
+    return U
+
+def make_scheme(name: str):
+    """ (方程式クラスのインスタンス, 初期値) """
+    if name.startswith('HeatEq'):
+        cfg = SimpleNamespace(settings=dict(SETTINGS), params=dict(PARAMS))
+        return getattr(DE, name)(cfg), 0.1*np.cos(np.linspace(0, 4*np.pi, N))
+    return getattr(DE, name)(dict(SETTINGS), dict(PARAMS)), initial(N)
+
+def root(scheme, U1) -> np.ndarray:
+    jac = lambda U2, U1: scheme.jacobian(U2, U1).toarray()
+    result = optimize.root(scheme.equation, U1, args=U1, method='hybr', jac=jac)
+    # 線形の方程式では1回で解けてそれ以上進まないので success ではなく残差で確かめる
+    assert np.abs(result.fun).max() <= 1e-10
+    return result.x
+
+@pytest.mark.parametrize('chord', [False, True])
+@pytest.mark.parametrize('name', ['CahnHilliardEq_NeumannBC_1d_DVDM', 'HeatEq_ReactionBC_1d_DVDM'])
+def test_newton_matches_root(name, chord):
+    scheme, U = make_scheme(name)
+    solver = NewtonSolver(chord=chord)
+    for _ in range(5):
+        expected = root(scheme, U)
+        result = solver.solve(scheme.equation, scheme.jacobian, U)
+        assert result.success
+        assert np.abs(result.x - expected).max() <= 1e-9
+        assert np.abs(result.fun).max() <= 1e-10
+        U = result.x
+
+@pytest.mark.parametrize('name', ['CahnHilliardEq_NeumannBC_1d_Stabilized', 'HeatEq_NeumannBC_1d_DVDM'])
+def test_banded_lu_matches_root(name):
+    scheme, U = make_scheme(name)
+    lu = banded_lu(scheme.system_matrix(U))
+    for _ in range(5):
+        expected = root(scheme, U)
+        dense = np.linalg.solve(scheme.system_matrix(U).toarray(), scheme.rhs(U))
+        U = lu_solve(lu, scheme.rhs(U))
+        assert np.abs(U - expected).max() <= 1e-10
+        assert np.abs(U - dense).max() <= 1e-12
+
+def test_unconverged_result_reports_residual_at_x():
+    scheme, U = make_scheme('CahnHilliardEq_NeumannBC_1d_DVDM')
+    result = NewtonSolver(maxiter=1, xtol=0.0).solve(scheme.equation, scheme.jacobian, U)
+    assert not result.success
+    np.testing.assert_array_equal(result.fun, scheme.equation(result.x, U))
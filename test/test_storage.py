@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from kkgw.math.Storage import TrajectoryStore
+
+def fill(store, steps, n: int = 20) -> dict:
+    """ 時刻ステップごとに違う解を追記して {時刻ステップ: 解} を返す """
+    rng = np.random.default_rng(0)
+    output = {}
+    for step in steps:
+        U = rng.standard_normal(n)
+        store.append(step, 0.1*step, U)
+        output[step] = U
+    return output
+
+def test_append_and_load(tmp_path):
+    with TrajectoryStore(str(tmp_path), 'U') as store:
+        written = fill(store, [0, 1, 10, 20, 30])
+    with TrajectoryStore(str(tmp_path), 'U') as store:
+        assert len(store) == 5
+        np.testing.assert_array_equal(store.steps, [0, 1, 10, 20, 30])
+        np.testing.assert_allclose(store.times, [0.0, 0.1, 1.0, 2.0, 3.0])
+        for step, U in written.items():
+            np.testing.assert_array_equal(store.load(step), U)
+        steps, times, data = store.window(5, 20)
+        np.testing.assert_array_equal(steps, [10, 20])
+        with pytest.raises(KeyError):
+            store.load(5)
+
+@pytest.mark.parametrize('policy', [None, {'compression': 'zlib'}])
+def test_truncate_and_append(tmp_path, policy):
+    store = TrajectoryStore(str(tmp_path), 'U', policy)
+    written = fill(store, [0, 1, 10, 20, 30])
+    store.truncate(10)
+    np.testing.assert_array_equal(store.steps, [0, 1, 10])
+    written.update(fill(store, [11, 20]))
+    store.close()
+
+    with TrajectoryStore(str(tmp_path), 'U') as store:
+        np.testing.assert_array_equal(store.steps, [0, 1, 10, 11, 20])
+        for step in store.steps:
+            np.testing.assert_array_equal(store.load(step), written[step])
+        store.truncate(-1)
+        assert len(store) == 0
+
+@pytest.mark.parametrize('policy, lossless, atol', [
+    ({'compression': 'zlib'}, True, 0.0),
+    ({'dtype': 'float32'}, False, 1e-6),
+    ({'dtype': 'float32', 'compression': 'zlib'}, False, 1e-6),
+    ({'tolerance': 1e-4}, False, 1e-4),
+])
+def test_policy_round_trip(tmp_path, policy, lossless, atol):
+    with TrajectoryStore(str(tmp_path), 'U', policy) as store:
+        written = fill(store, range(5))
+    with TrajectoryStore(str(tmp_path), 'U') as store:
+        assert store.lossless == lossless
+        assert store.compressed == (policy.get('compression') == 'zlib' or 'tolerance' in policy)
+        for step, U in written.items():
+            np.testing.assert_allclose(store.load(step), U, rtol=0, atol=atol*(1 + np.abs(U).max()))
+        np.testing.assert_allclose(np.asarray(store.data), np.array(list(written.values())), rtol=0, atol=atol*10)
+
+def test_every_and_stride(tmp_path):
+    with TrajectoryStore(str(tmp_path), 'U', {'every': 10, 'stride': 3}) as store:
+        written = fill(store, [0, 1, 10, 15, 20])
+    with TrajectoryStore(str(tmp_path), 'U') as store:
+        np.testing.assert_array_equal(store.steps, [0, 10, 20])
+        np.testing.assert_array_equal(store.positions(), np.arange(0, 20, 3))
+        np.testing.assert_array_equal(store.load(10), written[10][::3])
+
+def test_truncate_header_only_compressed_store(tmp_path):
+    # every で間引いてまだ記録がないときはヘッダーだけがある
+    with TrajectoryStore(str(tmp_path), 'dUdt', {'compression': 'zlib', 'every': 100}) as store:
+        fill(store, [1, 10, 50])
+        assert len(store) == 0
+        store.truncate(50)
+        fill(store, [100])
+        np.testing.assert_array_equal(store.steps, [100])